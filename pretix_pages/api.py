@@ -0,0 +1,268 @@
+import hashlib
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Max
+from django.utils.http import quote_etag
+from django.utils.timezone import now
+from pretix.api.serializers.i18n import I18nAwareModelSerializer
+from rest_framework import serializers, status, viewsets
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+
+from .cache import invalidate_pages_cache
+from .images import update_image_references
+from .models import Page, PageRender
+from .rendering import render_page
+from .sanitizer import clean_page_text
+
+BULK_BATCH_SIZE = 500
+UPDATE_FIELDS = ["position", "title", "text", "link_in_footer", "link_on_frontpage", "require_confirmation"]
+
+
+def next_position(event):
+    # New pages are added at the end, like in the control panel
+    return (event.page_set.aggregate(p=Max("position"))["p"] or 0) + 1
+
+
+def page_etag(page):
+    return quote_etag(
+        hashlib.sha1("{}-{}".format(page.pk, page.last_modified.isoformat()).encode()).hexdigest()
+    )
+
+
+class PageSerializer(I18nAwareModelSerializer):
+    etag = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Page
+        fields = ["id", "slug", "position", "title", "text", "link_in_footer", "link_on_frontpage",
+                  "require_confirmation", "last_modified", "etag"]
+        read_only_fields = ["id", "last_modified", "etag"]
+
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop("fields", None)
+        super().__init__(*args, **kwargs)
+        if fields:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+    def get_etag(self, page):
+        return page_etag(page)
+
+    def validate_slug(self, slug):
+        if self.instance and self.instance.slug != slug:
+            raise ValidationError("The slug of a page can not be changed.")
+        if not self.instance and Page.objects.filter(event=self.context["event"], slug=slug).exists():
+            raise ValidationError("A page with this slug already exists.")
+        return slug
+
+    def validate_text(self, text):
+        return clean_page_text(text, self.context["event"].organizer)
+
+
+class PageViewSet(viewsets.ModelViewSet):
+    """
+    Pages of an event. Responses for single pages carry an ``ETag`` header, which
+    can be used with ``If-None-Match`` to skip downloading unchanged pages and with
+    ``If-Match`` to only change or delete a page if it has not been changed since.
+    The ``fields`` query parameter limits the returned fields, e.g. to leave out the
+    content of the pages.
+    """
+
+    serializer_class = PageSerializer
+    queryset = Page.objects.none()
+    lookup_field = "slug"
+    lookup_value_regex = "[a-zA-Z0-9.-]+"
+    permission = "can_change_event_settings"
+    write_permission = "can_change_event_settings"
+
+    def get_requested_fields(self):
+        fields = self.request.query_params.get("fields")
+        if fields:
+            return [f.strip() for f in fields.split(",") if f.strip()]
+
+    def get_queryset(self):
+        qs = Page.objects.filter(event=self.request.event)
+        fields = self.get_requested_fields()
+        if fields and self.request.method == "GET":
+            model_fields = {f.name for f in Page._meta.concrete_fields}
+            # The ETag is derived from the primary key and the modification date
+            qs = qs.only(*({"id", "last_modified"} | (set(fields) & model_fields)))
+        return qs
+
+    def get_serializer(self, *args, **kwargs):
+        if self.request.method == "GET":
+            kwargs.setdefault("fields", self.get_requested_fields())
+        return super().get_serializer(*args, **kwargs)
+
+    def get_serializer_context(self):
+        ctx = super().get_serializer_context()
+        ctx["event"] = self.request.event
+        return ctx
+
+    def check_precondition(self, page):
+        if_match = self.request.headers.get("If-Match")
+        if if_match and if_match.strip() != "*" and page_etag(page) not in [e.strip() for e in if_match.split(",")]:
+            return Response({"detail": "The page has been changed in the meantime."},
+                            status=status.HTTP_412_PRECONDITION_FAILED)
+
+    def list(self, request, *args, **kwargs):
+        stats = self.get_queryset().aggregate(c=Count("id"), m=Max("last_modified"))
+        etag = quote_etag(hashlib.sha1("{}-{}-{}".format(
+            stats["c"], stats["m"].isoformat() if stats["m"] else "", request.query_params.urlencode()
+        ).encode()).hexdigest())
+        if etag in request.headers.get("If-None-Match", ""):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+        resp = super().list(request, *args, **kwargs)
+        resp["ETag"] = etag
+        return resp
+
+    def retrieve(self, request, *args, **kwargs):
+        page = self.get_object()
+        etag = page_etag(page)
+        if etag in request.headers.get("If-None-Match", ""):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+        return Response(self.get_serializer(page).data, headers={"ETag": etag})
+
+    def update(self, request, *args, **kwargs):
+        failed = self.check_precondition(self.get_object())
+        if failed:
+            return failed
+        resp = super().update(request, *args, **kwargs)
+        resp["ETag"] = resp.data["etag"]
+        return resp
+
+    def destroy(self, request, *args, **kwargs):
+        failed = self.check_precondition(self.get_object())
+        if failed:
+            return failed
+        return super().destroy(request, *args, **kwargs)
+
+    @transaction.atomic()
+    def perform_create(self, serializer):
+        try:
+            with transaction.atomic():
+                if "position" in serializer.validated_data:
+                    serializer.save(event=self.request.event)
+                else:
+                    serializer.save(event=self.request.event, position=next_position(self.request.event))
+        except IntegrityError:
+            raise ValidationError({"slug": ["A page with this slug already exists."]})
+        serializer.instance.log_action(
+            "pretix_pages.page.added",
+            user=self.request.user,
+            auth=self.request.auth,
+            data=self.request.data,
+        )
+        render_page(serializer.instance, self.request.event.settings.locales, sanitized=True)
+        update_image_references([serializer.instance], created=True)
+        invalidate_pages_cache(self.request.event)
+
+    @transaction.atomic()
+    def perform_update(self, serializer):
+        serializer.save()
+        serializer.instance.log_action(
+            "pretix_pages.page.changed",
+            user=self.request.user,
+            auth=self.request.auth,
+            data=self.request.data,
+        )
+        # Content that is not part of the request comes from the database and may
+        # have been stored before it was sanitized on save
+        render_page(
+            serializer.instance, self.request.event.settings.locales,
+            sanitized="text" in serializer.validated_data,
+        )
+        update_image_references([serializer.instance])
+        invalidate_pages_cache(self.request.event)
+
+    @transaction.atomic()
+    def perform_destroy(self, instance):
+        instance.log_action(
+            "pretix_pages.page.deleted",
+            user=self.request.user,
+            auth=self.request.auth,
+        )
+        super().perform_destroy(instance)
+        invalidate_pages_cache(self.request.event)
+
+    @action(detail=False, methods=["POST"])
+    def bulk_upsert(self, request, *args, **kwargs):
+        """
+        Creates or updates a list of pages, identified by their slug. Pages that would
+        not change are skipped. The pages are written in batches, with a single log
+        entry and cache invalidation for the whole call.
+        """
+        if not isinstance(request.data, list):
+            raise ValidationError("Expected a list of pages.")
+
+        results = []
+        with transaction.atomic():
+            for offset in range(0, len(request.data), BULK_BATCH_SIZE):
+                results += self._upsert_batch(request.data[offset:offset + BULK_BATCH_SIZE])
+
+            changed = sum(1 for r in results if r["status"] != "unchanged")
+            if changed:
+                request.event.log_action(
+                    "pretix_pages.pages.imported",
+                    user=request.user,
+                    auth=request.auth,
+                    data={"count": changed},
+                )
+                invalidate_pages_cache(request.event)
+        return Response(results)
+
+    def _upsert_batch(self, items):
+        slugs = [item.get("slug") for item in items if isinstance(item, dict) and isinstance(item.get("slug"), str)]
+        if len(slugs) != len(items) or len(set(slugs)) != len(slugs):
+            raise ValidationError("Every page needs a slug and every slug may only be used once.")
+
+        existing = {p.slug: p for p in Page.objects.filter(event=self.request.event, slug__in=slugs)}
+        context = self.get_serializer_context()
+        created, updated, results, errors = [], [], [], {}
+        position = None
+        for item in items:
+            page = existing.get(item["slug"])
+            serializer = PageSerializer(instance=page, data=item, partial=page is not None, context=context)
+            if not serializer.is_valid():
+                errors[item["slug"]] = serializer.errors
+                continue
+            data = serializer.validated_data
+
+            if page is None:
+                page = Page(event=self.request.event, **data)
+                if "position" not in data:
+                    if position is None:
+                        position = next_position(self.request.event)
+                    page.position = position
+                    position += 1
+                created.append(page)
+                results.append({"slug": page.slug, "status": "created", "page": page})
+                continue
+
+            changed = False
+            for name in UPDATE_FIELDS:
+                if name in data and getattr(page, name) != data[name]:
+                    setattr(page, name, data[name])
+                    changed = True
+            if changed:
+                page.last_modified = now()
+                updated.append(page)
+            results.append({"slug": page.slug, "status": "updated" if changed else "unchanged", "page": page})
+
+        if errors:
+            raise ValidationError(errors)
+
+        Page.objects.bulk_create(created)
+        Page.objects.bulk_update(updated, fields=UPDATE_FIELDS + ["last_modified"])
+        # Stored renders of changed pages are re-created when the cache is warmed again
+        PageRender.objects.filter(page__in=updated).delete()
+        update_image_references(created, created=True)
+        update_image_references(updated)
+
+        for r in results:
+            page = r.pop("page")
+            r["id"] = page.pk
+            r["etag"] = page_etag(page)
+        return results
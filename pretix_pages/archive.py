@@ -0,0 +1,271 @@
+"""
+Export and import of pages as ZIP archives.
+
+An archive contains a file ``pages.jsonl`` with one page per line and the images
+referenced by the pages in the ``images/`` folder. Within the page content, images
+are referenced as ``pretix-pages-image:<file name>``, so the archive can be
+imported into events of any organizer.
+
+Both directions process pages one batch at a time and images one file at a time,
+so memory use does not depend on the size of the archive.
+"""
+import hashlib
+import io
+import json
+import re
+import zipfile
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils.timezone import now
+from django.utils.translation import gettext as _
+from i18nfield.strings import LazyI18nString
+from PIL import Image
+
+from .cache import invalidate_pages_cache
+from .images import (
+    IMAGE_FILENAME, MIME_TYPES, store_image, update_image_references,
+)
+from .models import Page, PageRender
+from .sanitizer import clean_page_text
+
+IMAGE_REFERENCE = "pretix-pages-image:"
+BATCH_SIZE = 500
+PAGE_FIELDS = ("slug", "position", "title", "text", "link_in_footer", "link_on_frontpage", "require_confirmation")
+
+_slug_re = re.compile(r"^[a-zA-Z0-9.-]{1,150}$")
+_reference_re = re.compile(re.escape(IMAGE_REFERENCE) + "(" + IMAGE_FILENAME + ")")
+_image_file_re = re.compile(r"images/(([0-9a-f]{64})(?:-(\d+)x(\d+))?\.([a-z]+))")
+
+
+class ArchiveError(Exception):
+    pass
+
+
+class _StreamBuffer(io.RawIOBase):
+    """
+    A write-only file object collecting everything written to it until it is
+    drained, used to stream a ZIP file while it is being created.
+    """
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self._chunks.append(bytes(b))
+        return len(b)
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _map_i18n(data, func):
+    if isinstance(data, dict):
+        return {k: func(v) if v else v for k, v in data.items()}
+    return func(data) if data else data
+
+
+def export_pages(events):
+    """
+    Returns an iterator over the chunks of a ZIP archive containing all pages of the
+    given events.
+    """
+    buf = _StreamBuffer()
+    images = set()
+
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as zf:
+        with zf.open("pages.jsonl", "w") as f:
+            for event in events:
+                reference_re = re.compile(
+                    r"""[^\s"'<>,]*pub/{}/pages/img/({})""".format(
+                        re.escape(event.organizer.slug), IMAGE_FILENAME
+                    )
+                )
+
+                def replace(m):
+                    images.add((event.organizer.slug, m.group(1)))
+                    return IMAGE_REFERENCE + m.group(1)
+
+                qs = Page.objects.filter(event=event).order_by("position", "title").values_list(*PAGE_FIELDS)
+                for values in qs.iterator(chunk_size=BATCH_SIZE):
+                    record = dict(zip(PAGE_FIELDS, values))
+                    record["event"] = event.slug
+                    record["title"] = record["title"].data
+                    record["text"] = _map_i18n(record["text"].data, lambda t: reference_re.sub(replace, t))
+                    f.write(json.dumps(record).encode() + b"\n")
+                    yield buf.drain()
+
+        written = set()
+        for organizer_slug, filename in sorted(images):
+            name = "pub/{}/pages/img/{}".format(organizer_slug, filename)
+            if filename in written or not default_storage.exists(name):
+                continue
+            with default_storage.open(name) as src, zf.open("images/" + filename, "w") as dst:
+                while True:
+                    chunk = src.read(1024 * 64)
+                    if not chunk:
+                        break
+                    dst.write(chunk)
+                    yield buf.drain()
+            written.add(filename)
+
+    yield buf.drain()
+
+
+def _read_pages(zf):
+    try:
+        f = zf.open("pages.jsonl")
+    except KeyError:
+        raise ArchiveError(_("The archive does not contain any pages."))
+    with f:
+        batch = []
+        for lineno, line in enumerate(io.TextIOWrapper(f, encoding="utf-8"), start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                raise ArchiveError(_("Line {line} of the page list is not valid JSON.").format(line=lineno))
+            if (
+                not isinstance(record, dict)
+                or not _slug_re.fullmatch(str(record.get("slug", "")))
+                or not isinstance(record.get("position", 0), int)
+                or isinstance(record.get("position"), bool)
+            ):
+                raise ArchiveError(_("Line {line} of the page list does not contain a valid page.").format(line=lineno))
+            batch.append(record)
+            if len(batch) >= BATCH_SIZE:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+
+def _archive_images(zf):
+    """
+    Returns the file names of all images in the archive, mapped to the file to
+    import for them. Variants of optimized images are named after the original
+    image, which is not contained in archives. For them, the largest variant of the
+    same image is imported, and the variants are created again from it.
+    """
+    digests, largest = {}, {}
+    for name in zf.namelist():
+        m = _image_file_re.fullmatch(name)
+        if not m:
+            continue
+        filename, digest, width = m.group(1, 2, 3)
+        digests[filename] = digest if width else None
+        if width and int(width) > largest.get(digest, (0, None))[0]:
+            largest[digest] = (int(width), filename)
+    return {filename: largest[digest][1] if digest else filename for filename, digest in digests.items()}
+
+
+def _import_image(zf, filename, organizer):
+    """
+    Stores the image ``filename`` of the archive for ``organizer`` and returns its
+    URL. The image is checked against its file name and stored like an uploaded
+    image, so only valid images end up in the public file storage.
+    """
+    invalid = ArchiveError(_("The image {name} in the archive is not valid.").format(name=filename))
+    info = zf.getinfo("images/" + filename)
+    if info.file_size > settings.FILE_UPLOAD_MAX_SIZE_IMAGE:
+        raise ArchiveError(_("The image {name} in the archive is too large.").format(name=filename))
+    content = zf.read(info)
+
+    digest, width, height, extension = _image_file_re.fullmatch(info.filename).group(2, 3, 4, 5)
+    if not width and hashlib.sha256(content).hexdigest() != digest:
+        raise invalid
+    try:
+        with Image.open(io.BytesIO(content)) as im:
+            ftype, size = im.get_format_mimetype(), im.size
+    except Exception:  # Pillow raises all kinds of exceptions for broken files
+        raise invalid
+    if MIME_TYPES.get(ftype) != extension or (width and size != (int(width), int(height))):
+        raise invalid
+
+    try:
+        return store_image(organizer, ContentFile(content))["src"]
+    except ValueError:
+        raise invalid
+
+
+def _import_images(zf, text, organizer, archive_images, imported):
+    def replace(m):
+        filename = archive_images.get(m.group(1))
+        if filename is None:
+            raise ArchiveError(
+                _("The image {name} is missing from the archive.").format(name=m.group(1))
+            )
+        if filename not in imported:
+            imported[filename] = _import_image(zf, filename, organizer)
+        return imported[filename]
+
+    return _reference_re.sub(replace, text)
+
+
+def import_pages(fileobj, events, user=None):
+    """
+    Imports the pages from the archive ``fileobj`` into all of the given events.
+    Pages are matched by their slug, existing pages are updated and all other pages
+    are created. Every event is imported in a single transaction.
+
+    Returns the number of imported pages per event.
+    """
+    try:
+        zf = zipfile.ZipFile(fileobj)
+    except zipfile.BadZipFile:
+        raise ArchiveError(_("The file is not a valid ZIP archive."))
+
+    counts = {}
+    with zf:
+        archive_images = _archive_images(zf)
+        for event in events:
+            imported_images = {}
+            count = 0
+            with transaction.atomic():
+                for batch in _read_pages(zf):
+                    records = {r["slug"]: r for r in batch}  # later lines win
+                    existing = {
+                        p.slug: p for p in Page.objects.filter(event=event, slug__in=records.keys())
+                    }
+                    created, updated = [], []
+                    for slug, record in records.items():
+                        page = existing.get(slug) or Page(event=event, slug=slug)
+                        page.position = int(record.get("position") or 0)
+                        page.title = LazyI18nString(record.get("title") or "")
+                        page.text = clean_page_text(
+                            LazyI18nString(_map_i18n(
+                                record.get("text") or "",
+                                lambda t: _import_images(zf, str(t), event.organizer, archive_images, imported_images)
+                            )),
+                            event.organizer,
+                        )
+                        page.link_in_footer = bool(record.get("link_in_footer"))
+                        page.link_on_frontpage = bool(record.get("link_on_frontpage"))
+                        page.require_confirmation = bool(record.get("require_confirmation"))
+                        page.last_modified = now()
+                        (updated if page.pk else created).append(page)
+
+                    Page.objects.bulk_create(created)
+                    Page.objects.bulk_update(updated, fields=[
+                        "position", "title", "text", "link_in_footer", "link_on_frontpage",
+                        "require_confirmation", "last_modified",
+                    ])
+                    # Stored renders of updated pages are outdated now, they are re-created
+                    # when the cache is warmed again.
+                    PageRender.objects.filter(page__in=updated).delete()
+                    update_image_references(created, created=True)
+                    update_image_references(updated)
+                    count += len(records)
+
+                event.log_action("pretix_pages.pages.imported", user=user, data={"count": count})
+                invalidate_pages_cache(event)
+            counts[event] = count
+    return counts
@@ -0,0 +1,323 @@
+import gzip
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache as default_cache
+from django.db import transaction
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+from pretix.base.cache import NamespacedCache
+from pretix.multidomain.urlreverse import eventreverse
+
+from .metrics import measure, record_cache_access
+from .models import Page
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+# Seconds after which a manifest rebuild is assumed to have failed
+MANIFEST_LOCK_TIMEOUT = 10
+# Seconds for which the last built manifest can be served while it is re-built
+MANIFEST_STALE_TIMEOUT = 86400
+# Seconds a request waits for a concurrent rebuild if there is no manifest to serve
+MANIFEST_WAIT_TIMEOUT = 1
+
+
+class LocalCache:
+    """
+    A small least-recently-used cache in the memory of the current process.
+    Entries expire after ``timeout`` seconds, even if they are still in use.
+    """
+
+    def __init__(self, maxsize, timeout):
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.timeout, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+local_manifests = LocalCache(maxsize=1000, timeout=300)
+# Version stamps fetched from the shared cache during the current request, see
+# pages_version()
+_request_versions = threading.local()
+
+
+def begin_request():
+    _request_versions.data = {}
+
+
+def end_request():
+    _request_versions.data = None
+
+
+def pages_cache(event):
+    """
+    Returns a cache for the data of this plugin related to ``event``. In contrast to
+    ``event.cache``, it can be cleared when pages change without affecting the cached
+    data of pretix itself or other plugins.
+    """
+    return NamespacedCache("pretix_pages:{}".format(event.pk))
+
+
+def invalidate_pages_cache(event):
+    """
+    Clears the cached data of this plugin for ``event`` and re-builds it in the
+    background once the current transaction has been committed. The cache is
+    cleared again at that point, so requests running in between can not leave
+    outdated data in the cache.
+    """
+    from .tasks import warm_pages_cache
+
+    lock_key, _ = _manifest_keys(event)
+
+    def on_commit():
+        pages_cache(event).clear()
+        local_manifests.delete(event.pk)
+        _forget_version(event)
+        # A rebuild that is still running started before the change, so it must not
+        # keep the next rebuild from running
+        default_cache.delete(lock_key)
+        warm_pages_cache.apply_async(kwargs={"event": event.pk})
+
+    pages_cache(event).clear()
+    default_cache.delete(lock_key)
+    local_manifests.delete(event.pk)
+    _forget_version(event)
+    transaction.on_commit(on_commit)
+
+
+def event_layout_version(event):
+    """
+    Returns a timestamp that changes whenever pretix clears the cache of ``event``,
+    e.g. because its settings or layout have been changed.
+    """
+    return event.cache.get_or_set(
+        "pages_layout_version", lambda: int(time.time()), timeout=86400
+    )
+
+
+def pages_version(event):
+    """
+    Returns the version stamp of the namespace of ``pages_cache(event)``, which
+    changes whenever pages of ``event`` are changed. Like ``event_layout_version``,
+    it starts out as a timestamp.
+
+    Within a request, it is only fetched from the shared cache once, even though
+    the view and every presale signal receiver need it.
+    """
+    versions = getattr(_request_versions, "data", None)
+    if versions is not None and event.pk in versions:
+        return versions[event.pk]
+    prefixkey = pages_cache(event).prefixkey
+    version = default_cache.get(prefixkey)
+    if version is None:
+        # Start the namespace the same way NamespacedCache does on first use
+        default_cache.add(prefixkey, int(time.time()))
+        version = default_cache.get(prefixkey)
+    if versions is not None:
+        versions[event.pk] = version
+    return version
+
+
+def _forget_version(event):
+    versions = getattr(_request_versions, "data", None)
+    if versions is not None:
+        versions.pop(event.pk, None)
+
+
+def build_page_manifest(event):
+    return [
+        {
+            "id": pk,
+            "slug": slug,
+            "position": position,
+            "title": title,
+            "url": eventreverse(event, "plugins:pretix_pages:show", kwargs={"slug": slug}),
+            "link_in_footer": link_in_footer,
+            "link_on_frontpage": link_on_frontpage,
+            "require_confirmation": require_confirmation,
+            "last_modified": last_modified,
+        }
+        for pk, slug, position, title, link_in_footer, link_on_frontpage, require_confirmation, last_modified
+        in Page.objects.filter(event=event).values_list(
+            "pk", "slug", "position", "title", "link_in_footer", "link_on_frontpage", "require_confirmation",
+            "last_modified",
+        )
+    ]
+
+
+def _manifest_keys(event):
+    return "pretix_pages:{}:manifest_lock".format(event.pk), "pretix_pages:{}:manifest_stale".format(event.pk)
+
+
+def _manifest_key(event, version):
+    # The key within the given version of the namespace, so a manifest built from
+    # pages read before the namespace has been cleared is not stored in the new one
+    return pages_cache(event)._prefix_key("pages_manifest", known_prefix=version)
+
+
+def _rebuild_page_manifest(event, version):
+    """
+    Re-builds the manifest of ``event`` in only one process at a time. Concurrent
+    requests are served the manifest that was built last, even though it may be
+    outdated for a moment. If there is none, they wait briefly for the rebuild and
+    only build the manifest themselves if it takes too long.
+
+    Returns the manifest and whether it is up to date.
+    """
+    lock_key, stale_key = _manifest_keys(event)
+    key = _manifest_key(event, version)
+    token = uuid.uuid4().hex
+    if default_cache.add(lock_key, token, timeout=MANIFEST_LOCK_TIMEOUT):
+        try:
+            with measure("build_manifest"):
+                manifest = build_page_manifest(event)
+            default_cache.set(key, manifest, timeout=300)
+            default_cache.set(stale_key, manifest, timeout=MANIFEST_STALE_TIMEOUT)
+        finally:
+            if default_cache.get(lock_key) == token:
+                default_cache.delete(lock_key)
+        return manifest, True
+
+    manifest = default_cache.get(stale_key)
+    record_cache_access("manifest_stale", manifest is not None)
+    if manifest is not None:
+        return manifest, False
+
+    deadline = time.monotonic() + MANIFEST_WAIT_TIMEOUT
+    while time.monotonic() < deadline:
+        time.sleep(0.05)
+        manifest = default_cache.get(key)
+        if manifest is not None:
+            return manifest, True
+    with measure("build_manifest"):
+        return build_page_manifest(event), True
+
+
+def get_page_manifest(event):
+    """
+    Returns the metadata of all pages of ``event`` in their configured order, with
+    titles in all languages. This is shared by all presale signal receivers, so it
+    only needs to be built once after pages have been changed.
+
+    The manifest is kept in the memory of the process as well. It is only used
+    from there as long as the namespace of the shared cache has not changed, so
+    only this version stamp needs to be fetched from the shared cache, at most
+    once per request.
+    """
+    version = pages_version(event)
+    entry = local_manifests.get(event.pk)
+    record_cache_access("manifest_local", entry is not None and entry[0] == version)
+    if entry is not None and entry[0] == version:
+        return entry[1]
+
+    manifest = default_cache.get(_manifest_key(event, version))
+    record_cache_access("manifest", manifest is not None)
+    fresh = True
+    if manifest is None:
+        manifest, fresh = _rebuild_page_manifest(event, version)
+    if fresh and version is not None:
+        # The version has been read first, so if the cache has been cleared in the
+        # meantime, the entry is outdated already and will not be used.
+        local_manifests.set(event.pk, (version, manifest))
+    return manifest
+
+
+def response_cache_timeout():
+    """
+    Returns the number of seconds for which complete responses of public pages are
+    cached, or 0 if the response cache is disabled, which is the default.
+    """
+    return settings.CONFIG_FILE.getint("pretix_pages", "response_cache_timeout", fallback=0)
+
+
+def _accepted_encodings(request):
+    encodings = set()
+    for part in request.META.get("HTTP_ACCEPT_ENCODING", "").split(","):
+        coding, _, params = part.partition(";")
+        if params.replace(" ", "").lower() not in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            encodings.add(coding.strip().lower())
+    return encodings
+
+
+def _encoded_response(request, entry):
+    accepted = _accepted_encodings(request)
+    if entry["br"] is not None and "br" in accepted:
+        response = HttpResponse(entry["br"], content_type=entry["content_type"])
+        response["Content-Encoding"] = "br"
+    elif "gzip" in accepted:
+        response = HttpResponse(entry["gzip"], content_type=entry["content_type"])
+        response["Content-Encoding"] = "gzip"
+    else:
+        response = HttpResponse(entry["identity"], content_type=entry["content_type"])
+    patch_vary_headers(response, ("Accept-Encoding",))
+    return response
+
+
+def get_cached_response(request, key):
+    """
+    Returns the response cached for ``key`` for the event of ``request`` in the best
+    encoding the client accepts, or ``None`` if nothing is cached.
+    """
+    entry = pages_cache(request.event).get("response:" + key)
+    record_cache_access("response", entry is not None)
+    if entry is None:
+        return None
+    return _encoded_response(request, entry)
+
+
+def cache_response(request, key, response):
+    """
+    Stores the rendered ``response`` under ``key`` with precompressed variants and
+    returns the variant matching the encodings accepted by the client. Responses
+    that set cookies are not cached, as they are specific to the client.
+    """
+    response.render()
+    if (
+        response.status_code != 200
+        or response.cookies
+        or request.META.get("CSRF_COOKIE_NEEDS_UPDATE")
+        or request.session.modified
+    ):
+        return response
+
+    content = response.content
+    entry = {
+        "content_type": response["Content-Type"],
+        "identity": content,
+        "gzip": gzip.compress(content),
+        "br": brotli.compress(content) if brotli else None,
+    }
+    pages_cache(request.event).set("response:" + key, entry, response_cache_timeout())
+    return _encoded_response(request, entry)
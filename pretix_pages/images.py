@@ -0,0 +1,252 @@
+import hashlib
+import re
+from io import BytesIO
+from urllib.request import urlopen
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.utils.timezone import now
+from PIL import Image, ImageOps
+
+from .models import PageImageReference, PageImageUpload
+
+MIME_TYPES = {
+    "image/gif": "gif",
+    "image/jpeg": "jpg",
+    "image/png": "png",
+    "image/webp": "webp",
+}
+
+# Images are scaled down to fit into a square of this size
+MAX_DIMENSION = 2000
+# Additional smaller versions of every image for the srcset attribute
+VARIANT_WIDTHS = (480, 960, 1600)
+WEBP_QUALITY = 80
+
+_variant_re = re.compile(r"pub/([^/]+)/pages/img/([0-9a-f]{64})-(\d+)x(\d+)\.webp")
+# File names of stored images and their variants, without the organizer folder
+IMAGE_FILENAME = r"[0-9a-f]{64}(?:-\d+x\d+)?\.(?:" + "|".join(sorted(MIME_TYPES.values())) + ")"
+_reference_re = re.compile(r"pub/[a-zA-Z0-9.-]+/pages/img/" + IMAGE_FILENAME)
+
+
+def image_storage_name(organizer, filename):
+    return "pub/{}/pages/img/{}".format(organizer.slug, filename)
+
+
+def _save_image(name, content):
+    """
+    Stores ``content`` under ``name``, unless a file with that name exists. Names
+    are derived from the content of images, so a file stored under the same name
+    by another process in the meantime has the same content. Storages save the
+    second copy under a different name, which pages must not refer to, so it is
+    deleted again.
+    """
+    saved = default_storage.save(name, content)
+    if saved != name:
+        default_storage.delete(saved)
+    return name
+
+
+def _record_use(names):
+    """
+    Records that the images stored under ``names`` are about to be used in a page.
+    Their files may have been stored long before, so ``pages_gc_images`` can not
+    rely on the modification time of the files to keep them until the page is saved.
+    """
+    used = now()
+    PageImageUpload.objects.bulk_create(
+        [PageImageUpload(path=name, last_used=used) for name in names],
+        update_conflicts=True,
+        unique_fields=["path"],
+        update_fields=["last_used"],
+    )
+
+
+def _variant_sizes(width, height):
+    return [
+        (w, round(height * w / width)) for w in VARIANT_WIDTHS if w < width
+    ] + [(width, height)]
+
+
+def _variant_name(organizer_slug, digest, size):
+    return "pub/{}/pages/img/{}-{}x{}.webp".format(organizer_slug, digest, *size)
+
+
+def _image_attributes(organizer_slug, digest, width, height):
+    srcset = [
+        (size[0], default_storage.url(_variant_name(organizer_slug, digest, size)))
+        for size in _variant_sizes(width, height)
+    ]
+    return {
+        "src": srcset[-1][1],
+        "srcset": ", ".join("{} {}w".format(url, w) for w, url in srcset),
+        # Without sizes, browsers would scale small images to the full viewport width
+        "sizes": "(max-width: {w}px) 100vw, {w}px".format(w=width),
+        "width": str(width),
+        "height": str(height),
+        "loading": "lazy",
+    }
+
+
+def _optimize(organizer, fp, digest):
+    try:
+        with Image.open(fp) as im:
+            if getattr(im, "is_animated", False):
+                return None
+
+            width, height = im.size
+            if im.getexif().get(0x0112, 1) in (5, 6, 7, 8):  # rotated by 90 degrees
+                width, height = height, width
+            scale = min(1, MAX_DIMENSION / max(width, height))
+            width, height = max(1, round(width * scale)), max(1, round(height * scale))
+
+            _record_use([_variant_name(organizer.slug, digest, size) for size in _variant_sizes(width, height)])
+            missing = [
+                size for size in _variant_sizes(width, height)
+                if not default_storage.exists(_variant_name(organizer.slug, digest, size))
+            ]
+            if missing:
+                im = ImageOps.exif_transpose(im)
+                has_alpha = im.mode in ("RGBA", "LA", "PA") or "transparency" in im.info
+                im = im.convert("RGBA" if has_alpha else "RGB")
+                for size in missing:
+                    variant = im if size == im.size else im.resize(size, Image.LANCZOS)
+                    buf = BytesIO()
+                    variant.save(buf, format="WEBP", quality=WEBP_QUALITY)
+                    _save_image(_variant_name(organizer.slug, digest, size), ContentFile(buf.getvalue()))
+    except (OSError, Image.DecompressionBombError):
+        return None
+
+    return _image_attributes(organizer.slug, digest, width, height)
+
+
+def store_image(organizer, f):
+    """
+    Stores the image in the file ``f`` for ``organizer`` and returns the attributes
+    for the ``<img>`` element. The image is optimized if possible, and only stored
+    as it is otherwise. Files are named after the content of the image, so the same
+    image is only stored once. ``f`` is read in chunks, so large uploads do not
+    need to be kept in memory.
+
+    Raises ``ValueError`` if the file is not a valid image, or can neither be
+    optimized nor is in one of the ``MIME_TYPES``.
+    """
+    digest = hashlib.sha256()
+    for chunk in f.chunks():
+        digest.update(chunk)
+    digest = digest.hexdigest()
+
+    f.seek(0)
+    try:
+        with Image.open(f) as im:
+            ftype = im.get_format_mimetype()
+            im.verify()
+    except Exception:  # Pillow raises all kinds of exceptions for broken files
+        raise ValueError("The file is not a valid image")
+
+    f.seek(0)
+    attributes = _optimize(organizer, f, digest)
+    if attributes:
+        return attributes
+
+    if ftype not in MIME_TYPES:
+        raise ValueError("Unsupported image type")
+    name = image_storage_name(organizer, "{}.{}".format(digest, MIME_TYPES[ftype]))
+    _record_use([name])
+    if not default_storage.exists(name):
+        f.seek(0)
+        _save_image(name, f)
+    return {"src": default_storage.url(name), "loading": "lazy"}
+
+
+def copy_images(text, source, target, copied=None):
+    """
+    Copies all images of organizer ``source`` referenced in ``text`` to organizer
+    ``target`` and returns ``text`` with all references pointing to the copies.
+    Names of files already copied can be passed in ``copied`` to avoid checking
+    the storage again when processing multiple texts.
+    """
+    if copied is None:
+        copied = set()
+
+    def replace(m):
+        filename = m.group(1)
+        target_name = image_storage_name(target, filename)
+        if filename not in copied:
+            _record_use([target_name])
+            source_name = m.group(0)
+            if not default_storage.exists(target_name) and default_storage.exists(source_name):
+                with default_storage.open(source_name) as f:
+                    _save_image(target_name, ContentFile(f.read()))
+            copied.add(filename)
+        return target_name
+
+    return re.sub(
+        r"pub/{}/pages/img/({})".format(re.escape(source.slug), IMAGE_FILENAME),
+        replace,
+        text,
+    )
+
+
+def image_references(text):
+    """
+    Returns the storage names of all images referenced in ``text``, which can be a
+    string or an ``I18nField`` value with the content of all locales.
+    """
+    data = getattr(text, "data", text)
+    texts = data.values() if isinstance(data, dict) else [data]
+    return {m.group(0) for t in texts if t for m in _reference_re.finditer(str(t))}
+
+
+def update_image_references(pages, created=False):
+    """
+    Brings the index of images referenced by the content of ``pages`` up to date.
+    This needs to be called whenever the content of pages is saved. Pass
+    ``created=True`` for pages that have just been created, which can not have any
+    references stored yet.
+    """
+    wanted = {(page.pk, path) for page in pages for path in image_references(page.text)}
+    stale = []
+    if not created:
+        for pk, page_id, path in PageImageReference.objects.filter(page__in=pages).values_list("pk", "page_id", "path"):
+            if (page_id, path) in wanted:
+                wanted.remove((page_id, path))
+            else:
+                stale.append(pk)
+    if stale:
+        PageImageReference.objects.filter(pk__in=stale).delete()
+    PageImageReference.objects.bulk_create(
+        [PageImageReference(page_id=page_id, path=path) for page_id, path in wanted],
+        batch_size=500,
+    )
+
+
+def process_image(organizer, src):
+    """
+    Returns the attributes to set on an ``<img>`` element with the given ``src``.
+
+    Images embedded as ``data:`` URLs are stored with ``store_image()``. Images in
+    formats that can neither be optimized nor served as they are, such as SVG, stay
+    embedded. For images optimized before, the ``srcset`` is re-created, as the
+    editor does not keep it.
+    """
+    if src.startswith("data:"):
+        ftype = src.split(";")[0][5:].lower()
+        if not ftype.startswith("image/") or ftype == "image/svg+xml":
+            # SVG images can contain scripts, which would run if the stored file was
+            # opened directly. They stay embedded, where they are only shown as images.
+            return {}
+        try:
+            with urlopen(src) as response:
+                content = response.read()
+        except (ValueError, OSError):
+            return {}
+        try:
+            return store_image(organizer, ContentFile(content))
+        except ValueError:
+            return {}
+
+    m = _variant_re.search(src)
+    if m:
+        return _image_attributes(m.group(1), m.group(2), int(m.group(3)), int(m.group(4)))
+    return {"loading": "lazy"}
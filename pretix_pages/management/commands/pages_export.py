@@ -0,0 +1,48 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from django_scopes import scopes_disabled
+from pretix.base.models import Event
+
+from ...archive import export_pages
+
+
+class Command(BaseCommand):
+    help = "Export the pages of one or more events into a ZIP archive"
+
+    def add_arguments(self, parser):
+        parser.add_argument("organizer", help="Slug of the organizer")
+        parser.add_argument(
+            "--event",
+            action="append",
+            dest="events",
+            help="Slug of an event to export. Can be given multiple times. By default, the "
+                 "pages of all events of the organizer are exported.",
+        )
+        parser.add_argument(
+            "--output",
+            dest="output",
+            default="-",
+            help="File to write the archive to, or - for standard output.",
+        )
+
+    @scopes_disabled()
+    def handle(self, *args, **options):
+        events = Event.objects.filter(organizer__slug=options["organizer"]).select_related("organizer")
+        if options["events"]:
+            events = events.filter(slug__in=options["events"])
+        events = list(events.order_by("slug"))
+        if not events:
+            raise CommandError("No matching events found.")
+
+        if options["output"] == "-":
+            out = sys.stdout.buffer
+            for chunk in export_pages(events):
+                out.write(chunk)
+            out.flush()
+        else:
+            with open(options["output"], "wb") as out:
+                for chunk in export_pages(events):
+                    out.write(chunk)
+
+        self.stderr.write(self.style.SUCCESS(f"Exported the pages of {len(events)} events."))
@@ -0,0 +1,71 @@
+from django.core.management.base import BaseCommand
+from django.utils.timezone import now
+from django_scopes import scopes_disabled
+
+from ...cache import invalidate_pages_cache
+from ...images import update_image_references
+from ...models import Page
+from ...rendering import render_page
+from ...sanitizer import clean_page_text
+
+
+class Command(BaseCommand):
+    help = "Move images embedded into the content of pages to the file storage"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            dest="batch_size",
+            type=int,
+            default=100,
+            help="Number of pages loaded at once. Embedded images make pages large, so "
+                 "this is lower than for other commands.",
+        )
+        parser.add_argument(
+            "--start-after",
+            dest="start_after",
+            type=int,
+            default=0,
+            help="Only process pages with a higher ID, to resume an interrupted run.",
+        )
+
+    @scopes_disabled()
+    def handle(self, *args, **options):
+        qs = Page.objects.filter(text__contains="data:image/").select_related("event__organizer").order_by("pk")
+        changed = skipped = 0
+        last_pk = options["start_after"]
+        while True:
+            batch = list(qs.filter(pk__gt=last_pk)[:options["batch_size"]])
+            if not batch:
+                break
+
+            events = {}
+            for page in batch:
+                original = page.text.data if isinstance(page.text.data, str) else dict(page.text.data)
+                clean_page_text(page.text, page.event.organizer)
+                if page.text.data == original:
+                    continue
+                # The page is only changed if nobody else saved it since it was loaded,
+                # otherwise it is left alone and picked up by the next run.
+                loaded, page.last_modified = page.last_modified, now()
+                if not Page.objects.filter(pk=page.pk, last_modified=loaded).update(
+                    text=page.text, last_modified=page.last_modified
+                ):
+                    skipped += 1
+                    continue
+                render_page(page, page.event.settings.locales, sanitized=True)
+                update_image_references([page])
+                events[page.event_id] = page.event
+                changed += 1
+
+            for event in events.values():
+                invalidate_pages_cache(event)
+            last_pk = batch[-1].pk
+            self.stderr.write(f"Processed pages up to ID {last_pk}")
+
+        if skipped:
+            self.stderr.write(self.style.WARNING(
+                f"Skipped {skipped} pages that have been changed while they were processed, "
+                f"run the command again to process them."
+            ))
+        self.stderr.write(self.style.SUCCESS(f"Moved images out of {changed} pages."))
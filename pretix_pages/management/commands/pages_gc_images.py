@@ -0,0 +1,86 @@
+import re
+from datetime import timedelta
+from itertools import islice
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.utils.timezone import now
+
+from ...images import IMAGE_FILENAME
+from ...models import PageImageReference, PageImageUpload
+
+
+class Command(BaseCommand):
+    help = "Delete stored images that are no longer used by any page"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            dest="dry_run",
+            help="Only list the images that would be deleted.",
+        )
+        parser.add_argument(
+            "--grace-days",
+            dest="grace_days",
+            type=int,
+            default=7,
+            help="Keep images stored or uploaded again within this number of days, as images "
+                 "are uploaded before the page using them is saved.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            dest="batch_size",
+            type=int,
+            default=500,
+        )
+
+    def _image_names(self):
+        try:
+            organizers, _ = default_storage.listdir("pub/")
+        except FileNotFoundError:
+            return
+        for slug in sorted(organizers):
+            folder = "pub/{}/pages/img/".format(slug)
+            try:
+                _, files = default_storage.listdir(folder)
+            except FileNotFoundError:
+                continue
+            for filename in sorted(files):
+                if re.fullmatch(IMAGE_FILENAME, filename):
+                    yield folder + filename
+
+    def _unused(self, names, cutoff):
+        referenced = set(PageImageReference.objects.filter(path__in=names).values_list("path", flat=True))
+        # Images stored before may have been handed out again for a page that has not
+        # been saved yet, which does not change the files
+        recent = set(
+            PageImageUpload.objects.filter(path__in=names, last_used__gte=cutoff).values_list("path", flat=True)
+        )
+        return [
+            name for name in names
+            if name not in referenced and name not in recent and default_storage.get_modified_time(name) < cutoff
+        ]
+
+    def handle(self, *args, **options):
+        cutoff = now() - timedelta(days=options["grace_days"])
+        names = self._image_names()
+        deleted = 0
+        while True:
+            batch = list(islice(names, options["batch_size"]))
+            if not batch:
+                break
+            for name in self._unused(batch, cutoff):
+                if options["dry_run"]:
+                    self.stdout.write(name)
+                else:
+                    default_storage.delete(name)
+                deleted += 1
+
+        if not options["dry_run"]:
+            PageImageUpload.objects.filter(last_used__lt=cutoff).delete()
+
+        if options["dry_run"]:
+            self.stderr.write(self.style.SUCCESS(f"Would delete {deleted} unused images."))
+        else:
+            self.stderr.write(self.style.SUCCESS(f"Deleted {deleted} unused images."))
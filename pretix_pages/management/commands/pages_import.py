@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand, CommandError
+from django_scopes import scopes_disabled
+from pretix.base.models import Event
+
+from ...archive import ArchiveError, import_pages
+
+
+class Command(BaseCommand):
+    help = "Import pages from a ZIP archive into one or more events"
+
+    def add_arguments(self, parser):
+        parser.add_argument("archive", help="Archive created by pages_export or the page list")
+        parser.add_argument("organizer", help="Slug of the organizer")
+        parser.add_argument(
+            "--event",
+            action="append",
+            dest="events",
+            help="Slug of an event to import the pages into. Can be given multiple times. By "
+                 "default, the pages are imported into all events of the organizer.",
+        )
+
+    @scopes_disabled()
+    def handle(self, *args, **options):
+        events = Event.objects.filter(organizer__slug=options["organizer"]).select_related("organizer")
+        if options["events"]:
+            events = events.filter(slug__in=options["events"])
+        events = list(events.order_by("slug"))
+        if not events:
+            raise CommandError("No matching events found.")
+
+        with open(options["archive"], "rb") as f:
+            try:
+                counts = import_pages(f, events)
+            except ArchiveError as e:
+                raise CommandError(str(e))
+
+        for event, count in counts.items():
+            self.stderr.write(f"{event.slug}: {count} pages")
+        self.stderr.write(self.style.SUCCESS(f"Imported pages into {len(counts)} events."))
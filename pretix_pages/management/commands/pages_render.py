@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand
+from django_scopes import scopes_disabled
+
+from ...models import Page, PageRender
+from ...rendering import RENDER_VERSION, render_page
+
+
+class Command(BaseCommand):
+    help = "Fill the render store with the sanitized content of all pages"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            dest="all",
+            help="Re-render all pages, not only those without an up-to-date render, e.g. "
+                 "after the sanitizer policy has been changed.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            dest="batch_size",
+            type=int,
+            default=500,
+        )
+
+    @scopes_disabled()
+    def handle(self, *args, **options):
+        qs = Page.objects.select_related("event").order_by("pk")
+        rendered = 0
+        last_pk = 0
+        while True:
+            batch = list(qs.filter(pk__gt=last_pk)[:options["batch_size"]])
+            if not batch:
+                break
+
+            current = set(
+                PageRender.objects.filter(
+                    page__in=batch, version=RENDER_VERSION
+                ).values_list("page_id", "locale")
+            )
+            for page in batch:
+                locales = page.event.settings.locales
+                if options["all"] or any((page.pk, locale) not in current for locale in locales):
+                    render_page(page, locales)
+                    rendered += 1
+            last_pk = batch[-1].pk
+
+        self.stderr.write(self.style.SUCCESS(f"Rendered {rendered} pages."))
@@ -0,0 +1,135 @@
+"""
+Instrumentation of the caches and the rendering of this plugin.
+
+Measurements are passed to the backends configured with the ``metrics`` option in
+the ``[pretix_pages]`` section of the pretix configuration file, a comma-separated
+list of backend names or dotted paths to subclasses of ``MetricsBackend``. If no
+backend is configured, nothing is measured at all.
+"""
+import json
+import logging
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from django.conf import settings
+from django.db import connection
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger("pretix_pages.metrics")
+
+BACKENDS = {
+    "prometheus": "pretix_pages.metrics.PrometheusBackend",
+    "log": "pretix_pages.metrics.LogBackend",
+}
+
+_backends = {}
+
+
+class MetricsBackend:
+    def cache_access(self, cache, hit):
+        """
+        Called for every lookup in the cache named ``cache``.
+        """
+
+    def operation(self, operation, duration, queries):
+        """
+        Called after ``operation`` has finished, with the time it took in seconds and
+        the number of database queries it executed.
+        """
+
+
+class PrometheusBackend(MetricsBackend):
+    """
+    Records measurements with the metrics of pretix, which are exported in the
+    Prometheus text format if metrics are enabled in pretix.
+    """
+
+    def __init__(self):
+        from pretix.base.metrics import Counter, Histogram
+
+        self.cache_requests = Counter(
+            "pretix_pages_cache_requests_total", "Lookups in the caches of the pages plugin", ["cache", "result"]
+        )
+        self.duration = Histogram(
+            "pretix_pages_duration_seconds", "Time taken by operations of the pages plugin", ["operation"]
+        )
+        self.queries = Histogram(
+            "pretix_pages_queries", "Database queries executed by operations of the pages plugin", ["operation"],
+            buckets=(0, 1, 2, 3, 5, 10, 25, 50, float("inf")),
+        )
+
+    def cache_access(self, cache, hit):
+        self.cache_requests.inc(cache=cache, result="hit" if hit else "miss")
+
+    def operation(self, operation, duration, queries):
+        self.duration.observe(duration, operation=operation)
+        self.queries.observe(queries, operation=operation)
+
+
+class LogBackend(MetricsBackend):
+    """
+    Writes every measurement as a JSON object to the ``pretix_pages.metrics`` logger.
+    """
+
+    def cache_access(self, cache, hit):
+        logger.info(json.dumps({"type": "cache", "cache": cache, "result": "hit" if hit else "miss"}))
+
+    def operation(self, operation, duration, queries):
+        logger.info(json.dumps({
+            "type": "operation", "operation": operation, "duration": round(duration, 6), "queries": queries,
+        }))
+
+
+def get_backends():
+    names = settings.CONFIG_FILE.get("pretix_pages", "metrics", fallback="")
+    if names not in _backends:
+        _backends[names] = [
+            import_string(BACKENDS.get(name, name))()
+            for name in (n.strip() for n in names.split(","))
+            if name
+        ]
+    return _backends[names]
+
+
+def record_cache_access(cache, hit):
+    for backend in get_backends():
+        backend.cache_access(cache, hit)
+
+
+@contextmanager
+def measure(operation):
+    """
+    Measures the time taken and the database queries executed within the block.
+    """
+    backends = get_backends()
+    if not backends:
+        yield
+        return
+
+    queries = 0
+
+    def count_queries(execute, sql, params, many, context):
+        nonlocal queries
+        queries += 1
+        return execute(sql, params, many, context)
+
+    start = time.perf_counter()
+    with connection.execute_wrapper(count_queries):
+        yield
+    duration = time.perf_counter() - start
+    for backend in backends:
+        backend.operation(operation, duration, queries)
+
+
+def instrumented(operation):
+    """
+    Decorator measuring every call of the decorated function as ``operation``.
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with measure(operation):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-17 22:23
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("pretix_pages", "0004_auto_20170517_1550"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PageRender",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True, primary_key=True, serialize=False
+                    ),
+                ),
+                ("locale", models.CharField(max_length=190)),
+                ("content", models.TextField()),
+                ("version", models.PositiveIntegerField()),
+                (
+                    "page",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="renders",
+                        to="pretix_pages.page",
+                    ),
+                ),
+            ],
+            options={
+                "unique_together": {("page", "locale")},
+            },
+        ),
+    ]
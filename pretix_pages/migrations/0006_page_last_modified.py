@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 22:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("pretix_pages", "0005_pagerender"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="page",
+            name="last_modified",
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
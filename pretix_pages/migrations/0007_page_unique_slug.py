@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-17 22:42
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def rename_duplicate_slugs(apps, schema_editor):
+    """
+    Pages with a slug that is already used by another page of the same event were
+    never reachable, as only the first one is shown. They are kept, but moved to a
+    unique slug so the constraint can be created.
+    """
+    Page = apps.get_model("pretix_pages", "Page")
+    duplicates = (
+        Page.objects.values("event_id", "slug")
+        .annotate(c=Count("id"))
+        .filter(c__gt=1)
+    )
+    for dup in duplicates:
+        pages = Page.objects.filter(event_id=dup["event_id"], slug=dup["slug"]).order_by("id")
+        for page in pages[1:]:
+            suffix = "-{}".format(page.pk)
+            page.slug = page.slug[:150 - len(suffix)] + suffix
+            page.save(update_fields=["slug"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("pretix_pages", "0006_page_last_modified"),
+    ]
+
+    operations = [
+        migrations.RunPython(rename_duplicate_slugs, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name="page",
+            name="slug",
+            field=models.CharField(max_length=150),
+        ),
+        migrations.AddIndex(
+            model_name="page",
+            index=models.Index(fields=["event", "position"], name="pretix_pages_event_position"),
+        ),
+        migrations.AddConstraint(
+            model_name="page",
+            constraint=models.UniqueConstraint(fields=("event", "slug"), name="pretix_pages_page_event_slug"),
+        ),
+    ]
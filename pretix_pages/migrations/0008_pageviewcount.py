@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-17 22:59
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("pretix_pages", "0007_page_unique_slug"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PageViewCount",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True, primary_key=True, serialize=False
+                    ),
+                ),
+                ("locale", models.CharField(max_length=190)),
+                ("date", models.DateField()),
+                ("views", models.PositiveIntegerField(default=0)),
+                (
+                    "page",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="view_counts",
+                        to="pretix_pages.page",
+                    ),
+                ),
+            ],
+            options={
+                "unique_together": {("page", "locale", "date")},
+            },
+        ),
+    ]
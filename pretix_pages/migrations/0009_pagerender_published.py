@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 23:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("pretix_pages", "0008_pageviewcount"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="pagerender",
+            name="published",
+            field=models.CharField(max_length=40, null=True),
+        ),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 5.2.18 on 2026-10-17 23:23
+
+import re
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Same as ``pretix_pages.images._reference_re`` at the time of this migration
+reference_re = re.compile(r"pub/[a-zA-Z0-9.-]+/pages/img/[0-9a-f]{64}(?:-\d+x\d+)?\.[a-z]+")
+
+
+def index_image_references(apps, schema_editor):
+    Page = apps.get_model("pretix_pages", "Page")
+    PageImageReference = apps.get_model("pretix_pages", "PageImageReference")
+    last_pk = 0
+    while True:
+        # Pages with embedded images can be large, so they are loaded in small batches
+        batch = list(Page.objects.filter(pk__gt=last_pk).order_by("pk").only("id", "text")[:100])
+        if not batch:
+            break
+        references = []
+        for page in batch:
+            data = getattr(page.text, "data", page.text)
+            texts = data.values() if isinstance(data, dict) else [data]
+            paths = {m.group(0) for t in texts if t for m in reference_re.finditer(str(t))}
+            references += [PageImageReference(page_id=page.pk, path=path) for path in paths]
+        PageImageReference.objects.bulk_create(references)
+        last_pk = batch[-1].pk
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("pretix_pages", "0009_pagerender_published"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PageImageReference",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True, primary_key=True, serialize=False
+                    ),
+                ),
+                ("path", models.CharField(db_index=True, max_length=255)),
+                (
+                    "page",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="image_references",
+                        to="pretix_pages.page",
+                    ),
+                ),
+            ],
+            options={
+                "unique_together": {("page", "path")},
+            },
+        ),
+        migrations.RunPython(index_image_references, migrations.RunPython.noop),
+    ]
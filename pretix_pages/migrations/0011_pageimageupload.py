@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-18 00:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("pretix_pages", "0010_pageimagereference"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PageImageUpload",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True, primary_key=True, serialize=False
+                    ),
+                ),
+                ("path", models.CharField(max_length=255, unique=True)),
+                ("last_used", models.DateTimeField()),
+            ],
+        ),
+    ]
@@ -9,7 +9,6 @@ class Page(LoggedModel):
     event = models.ForeignKey("pretixbase.Event", on_delete=models.CASCADE)
     slug = models.CharField(
         max_length=150,
-        db_index=True,
         verbose_name=_("URL form"),
         validators=[
             RegexValidator(
@@ -40,6 +39,71 @@ class Page(LoggedModel):
             "order is created (e.g. for terms of service)."
         ),
     )
+    last_modified = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ["position", "title"]
+        constraints = [
+            models.UniqueConstraint(fields=["event", "slug"], name="pretix_pages_page_event_slug"),
+        ]
+        indexes = [
+            models.Index(fields=["event", "position"], name="pretix_pages_event_position"),
+        ]
+
+
+class PageRender(models.Model):
+    """
+    Stores the sanitized HTML of a page for one locale, so it does not need to be
+    sanitized again on every request.
+    """
+
+    page = models.ForeignKey(Page, on_delete=models.CASCADE, related_name="renders")
+    locale = models.CharField(max_length=190)
+    content = models.TextField()
+    version = models.PositiveIntegerField()
+    # Identifies the state the static file of the page has been published in, see
+    # ``pretix_pages.publish``
+    published = models.CharField(max_length=40, null=True)
+
+    class Meta:
+        unique_together = (("page", "locale"),)
+
+
+class PageViewCount(models.Model):
+    """
+    Number of times a page has been viewed in one locale on one day. Views are
+    counted in the cache and written here in batches, see ``pretix_pages.stats``.
+    """
+
+    page = models.ForeignKey(Page, on_delete=models.CASCADE, related_name="view_counts")
+    locale = models.CharField(max_length=190)
+    date = models.DateField()
+    views = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = (("page", "locale", "date"),)
+
+
+class PageImageReference(models.Model):
+    """
+    Storage name of an image the content of a page refers to. The index is updated
+    whenever the content of a page is saved and used to find images that are no
+    longer used, see the ``pages_gc_images`` management command.
+    """
+
+    page = models.ForeignKey(Page, on_delete=models.CASCADE, related_name="image_references")
+    path = models.CharField(max_length=255, db_index=True)
+
+    class Meta:
+        unique_together = (("page", "path"),)
+
+
+class PageImageUpload(models.Model):
+    """
+    Time an image has last been stored for use in a page, even if it had been
+    stored before. Pages are saved after their images have been uploaded, so the
+    ``pages_gc_images`` management command keeps images used recently.
+    """
+
+    path = models.CharField(max_length=255, unique=True)
+    last_used = models.DateTimeField()
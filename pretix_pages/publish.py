@@ -0,0 +1,157 @@
+"""
+Publishing of pages as static HTML files.
+
+If enabled for an event, every page is rendered in every locale of the event like
+it is shown to an anonymous visitor, including the layout of the event, and
+written to the file storage. Pages are only rendered again if they, the links to
+the other pages or the layout of the event have changed since they have been
+published.
+"""
+import hashlib
+import json
+import posixpath
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.handlers.base import BaseHandler
+from django.test import RequestFactory
+from django.utils import translation
+from pretix.multidomain.urlreverse import build_absolute_uri
+
+from .cache import event_layout_version, get_page_manifest
+from .models import Page, PageRender
+from .rendering import RENDER_VERSION
+
+_handler = None
+
+
+def static_pages_folder(event):
+    return "pub/{}/pages/{}/".format(event.organizer.slug, event.slug)
+
+
+def static_page_name(event, slug, locale):
+    return "{}{}/{}.html".format(static_pages_folder(event), slug, locale)
+
+
+def static_page_url(event, slug, locale):
+    """
+    Returns the URL of the static file of a page. Locales the event is not available
+    in fall back to the default locale of the event.
+    """
+    if locale not in event.settings.locales:
+        locale = event.settings.locale
+    return default_storage.url(static_page_name(event, slug, locale))
+
+
+def static_links_enabled(event):
+    return event.settings.pages_publish_static and event.settings.pages_static_links
+
+
+def links_stamp(event):
+    """
+    Returns a hash of the data of all pages of ``event`` that is shown on other
+    pages, e.g. in the links in the footer, so pages are published again if another
+    page is renamed or deleted.
+    """
+    return hashlib.sha1(json.dumps([
+        [
+            p["slug"], p["position"], getattr(p["title"], "data", p["title"]),
+            p["link_in_footer"], p["link_on_frontpage"], p["require_confirmation"],
+        ]
+        for p in get_page_manifest(event)
+    ], sort_keys=True).encode()).hexdigest()
+
+
+def publish_stamp(page, layout_version, links):
+    return hashlib.sha1(
+        "{}-{}-{}-{}-{}".format(page.pk, page.last_modified.timestamp(), RENDER_VERSION, layout_version, links).encode()
+    ).hexdigest()
+
+
+def render_static_page(event, slug, locale):
+    """
+    Renders a page through the complete request handling of pretix, like it would be
+    shown to an anonymous visitor using the given locale. Returns the HTML, or
+    ``None`` if the page could not be rendered.
+    """
+    global _handler
+    if _handler is None:
+        _handler = BaseHandler()
+        _handler.load_middleware()
+
+    url = urlsplit(build_absolute_uri(event, "plugins:pretix_pages:show", kwargs={"slug": slug}))
+    request = RequestFactory().get(url.path, HTTP_HOST=url.netloc, secure=url.scheme == "https")
+    request.COOKIES[settings.LANGUAGE_COOKIE_NAME] = locale
+    # Not a view by a visitor, see ShowPageView
+    request.pages_publish = True
+    with translation.override(translation.get_language()):
+        response = _handler.get_response(request)
+    if response.status_code != 200:
+        return None
+    return response.content
+
+
+def _write(name, content):
+    # Storages do not overwrite existing files, but save them under a different name
+    if default_storage.exists(name):
+        default_storage.delete(name)
+    default_storage.save(name, ContentFile(content))
+
+
+def _remove_unpublished(event, slugs, locales):
+    folder = static_pages_folder(event)
+    try:
+        folders, _ = default_storage.listdir(folder)
+    except FileNotFoundError:
+        return
+    for slug in folders:
+        files = default_storage.listdir(folder + slug)[1]
+        for filename in files:
+            if slug not in slugs or posixpath.splitext(filename)[0] not in locales:
+                default_storage.delete("{}{}/{}".format(folder, slug, filename))
+
+
+def publish_pages(event):
+    """
+    Writes the static files of all pages of ``event`` that have changed since they
+    have been published, and removes those of deleted pages and locales. Returns the
+    number of files written.
+    """
+    locales = event.settings.locales
+    layout_version = event_layout_version(event)
+    links = links_stamp(event)
+    published = {
+        (page_id, locale): stamp
+        for page_id, locale, stamp in PageRender.objects.filter(
+            page__event=event, locale__in=locales
+        ).values_list("page_id", "locale", "published")
+    }
+
+    written = 0
+    slugs = set()
+    for page in Page.objects.filter(event=event).only("id", "event", "slug", "last_modified"):
+        slugs.add(page.slug)
+        stamp = publish_stamp(page, layout_version, links)
+        for locale in locales:
+            if published.get((page.pk, locale)) == stamp:
+                continue
+            content = render_static_page(event, page.slug, locale)
+            if content is None:
+                continue
+            _write(static_page_name(event, page.slug, locale), content)
+            # Rendering the page has created the stored render, if there was none
+            PageRender.objects.filter(page=page, locale=locale).update(published=stamp)
+            written += 1
+
+    _remove_unpublished(event, slugs, set(locales))
+    return written
+
+
+def unpublish_pages(event):
+    """
+    Removes the static files of all pages of ``event``.
+    """
+    _remove_unpublished(event, set(), set())
+    PageRender.objects.filter(page__event=event).update(published=None)
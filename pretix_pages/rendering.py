@@ -0,0 +1,55 @@
+from django.utils.safestring import mark_safe
+
+from .metrics import measure, record_cache_access
+from .models import PageRender
+from .sanitizer import sanitize_page_content
+
+# Increase this whenever the output of sanitize_page_content() changes, e.g. because
+# the allow-list has been modified. Stored renders with an older version are then
+# re-created on first access, and the ``pages_render`` management command can be
+# used to re-create all of them at once.
+RENDER_VERSION = 4
+
+
+def render_page(page, locales, sanitized=False):
+    """
+    Sanitizes the content of ``page`` for each of the given locales and stores the
+    result in the render store. Returns a dictionary mapping locales to the
+    sanitized HTML.
+
+    Pass ``sanitized=True`` if the content of the page has just been sanitized with
+    the current policy, e.g. by ``PageForm``, to skip sanitizing it again.
+    """
+    contents = {}
+    results = {}  # locales without own content fall back to the same text
+    for locale in locales:
+        text = page.text.localize(locale) if page.text else ""
+        if text not in results:
+            results[text] = mark_safe(text) if sanitized else sanitize_page_content(text)
+        contents[locale] = results[text]
+    PageRender.objects.bulk_create(
+        [
+            PageRender(page=page, locale=locale, content=content, version=RENDER_VERSION)
+            for locale, content in contents.items()
+        ],
+        update_conflicts=True,
+        unique_fields=["page", "locale"],
+        update_fields=["content", "version"],
+    )
+    return contents
+
+
+def get_rendered_content(page, locale):
+    """
+    Returns the sanitized HTML of ``page`` in the given locale from the render store.
+    If it has not been rendered yet or was rendered with an outdated version, it is
+    rendered and stored now.
+    """
+    render = PageRender.objects.filter(
+        page=page, locale=locale, version=RENDER_VERSION
+    ).first()
+    record_cache_access("render", render is not None)
+    if render:
+        return mark_safe(render.content)
+    with measure("render_page"):
+        return render_page(page, [locale])[locale]
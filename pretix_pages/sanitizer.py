@@ -0,0 +1,150 @@
+import re
+import threading
+
+import lxml.html
+from django.utils.safestring import mark_safe
+
+from .images import process_image
+
+URL_ATTRIBUTES = {"href", "src"}
+SRCSET_ATTRIBUTES = {"srcset"}
+
+# Browsers ignore whitespace and control characters within URLs, so
+# "java\nscript:" needs to be treated like "javascript:". The parser replaces NUL
+# characters with U+FFFD, which is removed as well to stay on the safe side.
+_url_ignored_chars = re.compile(r"[\x00-\x20\ufffd]+")
+_srcset_descriptor = re.compile(r"^(\d+w|\d+(\.\d+)?x)$")
+_url_scheme = re.compile(r"^([a-zA-Z][a-zA-Z0-9+.-]*):")
+
+
+class SanitizerPolicy:
+    """
+    An allow-list based HTML sanitizer working on a single lxml parse of the input.
+
+    Elements not in ``tags`` are removed, but their content is kept, except for the
+    elements in ``drop_content`` which are removed including their content.
+    Attributes not listed for the element in ``attributes`` are removed, as well as
+    URLs using a protocol not in ``protocols``. ``data:`` URLs are only allowed for
+    images in the elements listed in ``data_uri_tags``.
+
+    Policy objects are immutable after creation and can be shared between threads,
+    every thread uses its own lxml parser.
+    """
+
+    def __init__(self, tags, attributes, protocols, data_uri_tags=(), drop_content=("script", "style")):
+        self.tags = frozenset(tags)
+        self.attributes = {tag: frozenset(attrs) for tag, attrs in attributes.items()}
+        self.protocols = frozenset(protocols)
+        self.data_uri_tags = frozenset(data_uri_tags)
+        self.drop_content = frozenset(drop_content)
+        self._local = threading.local()
+
+    @property
+    def parser(self):
+        parser = getattr(self._local, "parser", None)
+        if parser is None:
+            parser = self._local.parser = lxml.html.HTMLParser(
+                remove_comments=True, remove_pis=True
+            )
+        return parser
+
+    def url_allowed(self, tag, url):
+        url = _url_ignored_chars.sub("", url)
+        m = _url_scheme.match(url)
+        if not m:
+            return True  # relative URL
+        scheme = m.group(1).lower()
+        if scheme == "data":
+            ftype = url[5:].split(";")[0].split(",")[0].lower()
+            # Scripts in SVG images do not run when they are shown with <img>
+            return tag in self.data_uri_tags and ftype.startswith("image/")
+        return scheme in self.protocols
+
+    def srcset_allowed(self, tag, srcset):
+        for candidate in srcset.split(","):
+            if not candidate.strip():
+                continue
+            url, *descriptors = candidate.split()
+            if not self.url_allowed(tag, url) or not all(_srcset_descriptor.match(d) for d in descriptors):
+                return False
+        return True
+
+    def sanitize(self, html, image_callback=None):
+        """
+        Returns a sanitized version of ``html``.
+
+        If ``image_callback`` is given, it is called with the ``src`` attribute of
+        every image and needs to return a dictionary of attributes to set on the
+        image. This allows to process images in the same pass as the sanitization.
+        """
+        if not html or not html.strip():
+            return ""
+
+        root = lxml.html.fragment_fromstring(html, create_parent="div", parser=self.parser)
+        for el in list(root.iterdescendants()):
+            if not isinstance(el.tag, str):
+                # Entities and everything else the parser did not turn into an element
+                el.drop_tree()
+            elif el.tag in self.drop_content:
+                el.drop_tree()
+            elif el.tag not in self.tags:
+                el.drop_tag()
+            else:
+                if image_callback and el.tag == "img" and el.get("src"):
+                    for name, value in image_callback(el.get("src")).items():
+                        el.set(name, value)
+
+                allowed = self.attributes.get(el.tag, ())
+                for name, value in el.items():
+                    if (
+                        name not in allowed
+                        or (name in URL_ATTRIBUTES and not self.url_allowed(el.tag, value))
+                        or (name in SRCSET_ATTRIBUTES and not self.srcset_allowed(el.tag, value))
+                    ):
+                        del el.attrib[name]
+
+        # Strip the <div> and </div> of the container element
+        return lxml.html.tostring(root, encoding="unicode")[5:-6]
+
+
+page_policy = SanitizerPolicy(
+    tags={
+        "a", "abbr", "acronym", "b", "blockquote", "br", "code", "em", "h3", "h4", "h5",
+        "h6", "i", "img", "li", "ol", "p", "s", "strong", "sub", "sup", "u", "ul",
+    },
+    attributes={
+        "a": {"href", "title", "target"},
+        "abbr": {"title"},
+        "acronym": {"title"},
+        "p": {"class"},
+        "li": {"class"},
+        "img": {"src", "srcset", "sizes", "width", "height", "loading", "alt"},
+    },
+    protocols={"http", "https", "mailto"},
+    data_uri_tags={"img"},
+)
+
+
+def sanitize_page_content(text, image_callback=None):
+    return mark_safe(page_policy.sanitize(str(text), image_callback=image_callback))
+
+
+def clean_page_text(text, organizer):
+    """
+    Sanitizes all locales of the page content ``text`` in place. Images embedded in
+    the content are processed and stored for ``organizer``.
+    """
+    processed_images = {}
+
+    def image_callback(src):
+        # The same image is usually contained in the content of multiple locales
+        if src not in processed_images:
+            processed_images[src] = process_image(organizer, src)
+        return processed_images[src]
+
+    if isinstance(text.data, dict):
+        for locale, html in text.data.items():
+            text.data[locale] = page_policy.sanitize(html, image_callback=image_callback)
+    elif text.data:
+        text.data = page_policy.sanitize(text.data, image_callback=image_callback)
+    return text
@@ -1,17 +1,31 @@
+from django.core.signals import request_finished, request_started
 from django.dispatch import receiver
 from django.template.loader import get_template
 from django.urls import resolve, reverse
 from django.utils.html import format_html, format_html_join
 from django.utils.translation import get_language, gettext_lazy as _
-from pretix.base.signals import event_copy_data, logentry_display
+from django_scopes import scopes_disabled
+from i18nfield.strings import LazyI18nString
+from pretix.base.models import Event
+from pretix.base.settings import settings_hierarkey
+from pretix.base.signals import (
+    event_copy_data, logentry_display, periodic_task,
+)
 from pretix.control.signals import html_head, nav_event
-from pretix.multidomain.urlreverse import eventreverse
+from pretix.helpers.periodic import minimum_interval
 from pretix.presale.signals import (
     checkout_confirm_messages, footer_link, front_page_bottom,
     html_head as html_head_presale,
 )
 
-from .models import Page
+from .cache import (
+    begin_request, end_request, get_page_manifest, invalidate_pages_cache,
+)
+from .images import copy_images, update_image_references
+from .metrics import instrumented
+from .models import Page, PageRender
+from .publish import static_links_enabled, static_page_url
+from .stats import flush_page_views
 
 
 @receiver(nav_event, dispatch_uid="pages_nav")
@@ -39,10 +53,41 @@ def control_nav_pages(sender, request=None, **kwargs):
 
 @receiver(signal=event_copy_data, dispatch_uid="pages_copy_data")
 def event_copy_data_receiver(sender, other, **kwargs):
-    for p in Page.objects.filter(event=other):
+    pages = list(Page.objects.filter(event=other))
+    if not pages:
+        return
+    renders = list(PageRender.objects.filter(page__event=other))
+
+    if sender.organizer_id != other.organizer_id:
+        # Images are stored per organizer, so they need to be copied to keep working
+        # if the original organizer deletes them.
+        copied = set()
+        for p in pages:
+            data = p.text.data
+            if isinstance(data, dict):
+                p.text = LazyI18nString({
+                    k: copy_images(v, other.organizer, sender.organizer, copied) if v else v
+                    for k, v in data.items()
+                })
+            elif data:
+                p.text = LazyI18nString(copy_images(data, other.organizer, sender.organizer, copied))
+        for r in renders:
+            r.content = copy_images(r.content, other.organizer, sender.organizer, copied)
+
+    old_ids = [p.pk for p in pages]
+    for p in pages:
         p.pk = None
         p.event = sender
-        p.save()
+    Page.objects.bulk_create(pages, batch_size=500)
+    update_image_references(pages, created=True)
+
+    page_map = dict(zip(old_ids, pages))
+    for r in renders:
+        r.pk = None
+        r.page = page_map[r.page_id]
+    PageRender.objects.bulk_create(renders, batch_size=500)
+
+    invalidate_pages_cache(sender)
 
 
 @receiver(signal=logentry_display, dispatch_uid="pages_logentry_display")
@@ -52,43 +97,39 @@ def pretixcontrol_logentry_display(sender, logentry, **kwargs):
         "pretix_pages.page.added": _("The page has been created."),
         "pretix_pages.page.changed": _("The page has been modified."),
         "pretix_pages.page.deleted": _("The page has been deleted."),
+        "pretix_pages.pages.imported": _("Pages have been imported."),
     }
 
     if event_type in plains:
         return plains[event_type]
 
 
+def _with_static_links(event, pages):
+    # Links point to the static files of the pages, if the event is set up that way
+    if not static_links_enabled(event):
+        return pages
+    locale = get_language()
+    return [dict(p, url=static_page_url(event, p["slug"], locale)) for p in pages]
+
+
 @receiver(footer_link, dispatch_uid="pages_footer_links")
+@instrumented("footer_links")
 def footer_link_pages(sender, request=None, **kwargs):
-    cached = sender.cache.get("pages_footer_links_" + get_language())
-    if not cached:
-        cached = [
-            {
-                "label": p.title,
-                "url": eventreverse(
-                    sender, "plugins:pretix_pages:show", kwargs={"slug": p.slug}
-                ),
-            }
-            for p in Page.objects.filter(event=sender, link_in_footer=True)
-        ]
-        sender.cache.set("pages_footer_links_" + get_language(), cached)
-
-    return cached
+    return [
+        {"label": p["title"], "url": p["url"]}
+        for p in _with_static_links(sender, [p for p in get_page_manifest(sender) if p["link_in_footer"]])
+    ]
 
 
 @receiver(signal=front_page_bottom, dispatch_uid="pages_frontpage_links")
+@instrumented("frontpage_links")
 def pretixpresale_front_page_bottom(sender, **kwargs):
-    cached = sender.cache.get("pages_frontpage_links_" + get_language())
-    if cached is None:
-        pages = list(Page.objects.filter(event=sender, link_on_frontpage=True))
-        if pages:
-            template = get_template("pretix_pages/front_page.html")
-            cached = template.render({"event": sender, "pages": pages})
-        else:
-            cached = ""
-        sender.cache.set("pages_frontpage_links_" + get_language(), cached)
-
-    return cached
+    pages = [p for p in get_page_manifest(sender) if p["link_on_frontpage"]]
+    if not pages:
+        return ""
+    pages = _with_static_links(sender, pages)
+    template = get_template("pretix_pages/front_page.html")
+    return template.render({"event": sender, "pages": pages})
 
 
 @receiver(html_head, dispatch_uid="pages_html_head")
@@ -112,26 +153,54 @@ def html_head_presale(sender, request=None, **kwargs):
 
 
 @receiver(checkout_confirm_messages, dispatch_uid="pages_confirm_messages")
+@instrumented("confirm_messages")
 def confirm_messages(sender, *args, **kwargs):
-    cached = sender.cache.get("pages_confirm_messages_html_" + get_language())
-    if cached is None:
-        pages = list(Page.objects.filter(event=sender, require_confirmation=True))
-        if pages:
-            attrs_gen = (
-                {
-                    "title": str(p.title),
-                    "url": eventreverse(sender, "plugins:pretix_pages:show", kwargs={"slug": p.slug}),
-                }
-                for p in pages
-            )
-            plist = format_html_join(", ", '<a href="{url}" target="_blank">{title}</a>', attrs_gen)
-            cached = {
-                "pages": format_html(
-                    _("I have read and agree with the content of the following pages: {plist}"),
-                    plist=plist,
-                )
-            }
-        else:
-            cached = {}
-        sender.cache.set("pages_confirm_messages_html_" + get_language(), cached)
-    return cached
+    pages = [p for p in get_page_manifest(sender) if p["require_confirmation"]]
+    if not pages:
+        return {}
+    pages = _with_static_links(sender, pages)
+    attrs_gen = ({"title": str(p["title"]), "url": p["url"]} for p in pages)
+    plist = format_html_join(", ", '<a href="{url}" target="_blank">{title}</a>', attrs_gen)
+    return {
+        "pages": format_html(
+            _("I have read and agree with the content of the following pages: {plist}"),
+            plist=plist,
+        )
+    }
+
+
+@receiver(request_started, dispatch_uid="pages_request_started")
+def request_started_receiver(sender, **kwargs):
+    begin_request()
+
+
+@receiver(request_finished, dispatch_uid="pages_request_finished")
+def request_finished_receiver(sender, **kwargs):
+    end_request()
+
+
+@receiver(signal=periodic_task, dispatch_uid="pages_flush_views")
+@scopes_disabled()
+@minimum_interval(minutes_after_success=5)
+def flush_views(sender, **kwargs):
+    flush_page_views()
+
+
+@receiver(signal=periodic_task, dispatch_uid="pages_publish_static")
+@scopes_disabled()
+@minimum_interval(minutes_after_success=10)
+def publish_static_pages(sender, **kwargs):
+    # The layout of an event can be changed without any page being changed, which is
+    # noticed here. Unchanged pages are not rendered again.
+    from .tasks import warm_pages_cache
+
+    events = Event.objects.filter(
+        plugins__contains="pretix_pages", _settings_objects__key="pages_publish_static",
+        _settings_objects__value="True",
+    )
+    for event in events.only("pk"):
+        warm_pages_cache.apply_async(kwargs={"event": event.pk})
+
+
+settings_hierarkey.add_default("pages_publish_static", "False", bool)
+settings_hierarkey.add_default("pages_static_links", "False", bool)
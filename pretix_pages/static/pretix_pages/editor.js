@@ -29,6 +29,36 @@ $(function () {
     });
 
 
+    var upload_url = $("form[data-upload-url]").attr("data-upload-url");
+    var upload_images = function (range, files) {
+        // Images are stored right away instead of being embedded into the page content
+        var quill = this.quill;
+        files.reduce(function (previous, file) {
+            return previous.then(function (index) {
+                var data = new FormData();
+                data.append("image", file);
+                return fetch(upload_url, {
+                    method: "POST",
+                    body: data,
+                    credentials: "same-origin",
+                    headers: {"X-CSRFToken": $("input[name=csrfmiddlewaretoken]").val()},
+                }).then(function (response) {
+                    return response.json();
+                }).then(function (result) {
+                    if (!result.url) {
+                        alert(result.error);
+                        return index;
+                    }
+                    quill.insertEmbed(index, "image", result.url, Quill.sources.USER);
+                    quill.setSelection(index + 1, Quill.sources.SILENT);
+                    return index + 1;
+                });
+            });
+        }, Promise.resolve(range.index)).catch(function () {
+            alert(gettext("The image could not be uploaded."));
+        });
+    };
+
     var quills = {};
     $('.editor').each(function () {
         $(this).html($("textarea[name^=text_][lang=" + $(this).attr("data-lng") + "]").val());
@@ -48,7 +78,11 @@ $(function () {
                     [{'list': 'ordered'}, {'list': 'bullet'}],
                     [{'script': 'sub'}, {'script': 'super'}],
                     ['clean']
-                ]
+                ],
+                uploader: {
+                    mimetypes: ['image/gif', 'image/jpeg', 'image/png', 'image/webp'],
+                    handler: upload_images
+                }
             }
         });
     });
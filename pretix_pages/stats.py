@@ -0,0 +1,108 @@
+"""
+Counting of page views.
+
+Showing a page must not write to the database, so views are counted in the cache
+and periodically written to ``PageViewCount`` in batches.
+
+Counters are grouped into epochs. Every flush starts a new epoch and writes the
+counters of the epoch before the previous one, so requests that read the epoch
+number just before it changed have a full flush interval to finish counting. Each
+counter is registered in a numbered slot of its epoch when it is created, so the
+flush can find all of them without scanning the cache.
+"""
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.timezone import now
+
+from .models import Page, PageViewCount
+
+PREFIX = "pretix_pages:views"
+EPOCH_KEY = PREFIX + ":epoch"
+# Counters are only kept for a limited time, in case views are no longer flushed
+TIMEOUT = 7 * 86400
+BATCH_SIZE = 500
+
+
+def _current_epoch():
+    epoch = cache.get(EPOCH_KEY)
+    if epoch is None:
+        cache.add(EPOCH_KEY, 1, timeout=None)
+        epoch = cache.get(EPOCH_KEY, 1)
+    return epoch
+
+
+def count_page_view(event, page, locale):
+    """
+    Counts a view of ``page`` of ``event`` in ``locale``. Only the cache is written to.
+    """
+    epoch = _current_epoch()
+    date = now().astimezone(event.timezone).date().isoformat()
+    key = "{}:{}:{}:{}:{}".format(PREFIX, epoch, page.pk, locale, date)
+    try:
+        if cache.add(key, 1, timeout=TIMEOUT):
+            # The first view in this epoch registers the counter for the flush
+            slots_key = "{}:{}:slots".format(PREFIX, epoch)
+            cache.add(slots_key, 0, timeout=TIMEOUT)
+            slot = cache.incr(slots_key)
+            cache.set("{}:{}:slot:{}".format(PREFIX, epoch, slot), (page.pk, locale, date), timeout=TIMEOUT)
+        else:
+            cache.incr(key)
+    except ValueError:
+        # A key has been evicted from the cache in the meantime, the view is lost
+        pass
+
+
+def _store_counts(counts):
+    with transaction.atomic():
+        existing = {
+            (c.page_id, c.locale, c.date.isoformat()): c
+            for c in PageViewCount.objects.select_for_update().filter(
+                page_id__in={k[0] for k in counts}, date__in={k[2] for k in counts}
+            )
+        }
+        page_ids = set(Page.objects.filter(pk__in={k[0] for k in counts}).values_list("pk", flat=True))
+        created, updated, total = [], [], 0
+        for (page_id, locale, date), views in counts.items():
+            if (page_id, locale, date) in existing:
+                count = existing[page_id, locale, date]
+                count.views += views
+                updated.append(count)
+            elif page_id in page_ids:  # pages deleted in the meantime are skipped
+                created.append(PageViewCount(page_id=page_id, locale=locale, date=date, views=views))
+            else:
+                continue
+            total += views
+        PageViewCount.objects.bulk_create(created)
+        PageViewCount.objects.bulk_update(updated, fields=["views"])
+    return total
+
+
+def flush_page_views():
+    """
+    Starts a new epoch and writes the counters of the epoch before the previous one
+    to the database. Returns the number of views written.
+    """
+    cache.add(EPOCH_KEY, 1, timeout=None)
+    try:
+        epoch = cache.incr(EPOCH_KEY) - 2
+    except ValueError:  # no shared cache configured, nothing has been counted
+        return 0
+    if epoch < 1:
+        return 0
+
+    slots_key = "{}:{}:slots".format(PREFIX, epoch)
+    slots = cache.get(slots_key) or 0
+    total = 0
+    for offset in range(1, slots + 1, BATCH_SIZE):
+        slot_keys = [
+            "{}:{}:slot:{}".format(PREFIX, epoch, i) for i in range(offset, min(offset + BATCH_SIZE, slots + 1))
+        ]
+        entries = [tuple(e) for e in cache.get_many(slot_keys).values()]
+        counter_keys = {e: "{}:{}:{}:{}:{}".format(PREFIX, epoch, *e) for e in entries}
+        values = cache.get_many(counter_keys.values())
+        counts = {e: values[k] for e, k in counter_keys.items() if values.get(k)}
+        if counts:
+            total += _store_counts(counts)
+        cache.delete_many(slot_keys + list(counter_keys.values()))
+    cache.delete(slots_key)
+    return total
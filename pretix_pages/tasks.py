@@ -0,0 +1,34 @@
+from pretix.base.services.tasks import EventTask
+from pretix.celery_app import app
+
+from .cache import get_page_manifest
+from .models import Page, PageRender
+from .publish import publish_pages
+from .rendering import RENDER_VERSION, render_page
+
+
+@app.task(base=EventTask)
+def warm_pages_cache(event):
+    """
+    Re-builds the cached page data of ``event`` after pages have been changed, so
+    the first visitors do not need to wait for it. If enabled, the static files of
+    the changed pages are published as well.
+    """
+    get_page_manifest(event)
+
+    locales = event.settings.locales
+    current = set(
+        PageRender.objects.filter(
+            page__event=event, version=RENDER_VERSION, locale__in=locales
+        ).values_list("page_id", "locale")
+    )
+    outdated = [
+        pk for pk in Page.objects.filter(event=event).values_list("pk", flat=True)
+        if any((pk, locale) not in current for locale in locales)
+    ]
+    # Only load the content of pages that actually need to be rendered
+    for page in Page.objects.filter(pk__in=outdated):
+        render_page(page, [locale for locale in locales if (page.pk, locale) not in current])
+
+    if event.settings.pages_publish_static:
+        publish_pages(event)
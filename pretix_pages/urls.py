@@ -1,6 +1,8 @@
 from django.urls import path
+from pretix.api.urls import event_router
 
 from . import views
+from .api import PageViewSet
 
 urlpatterns = [
     path(
@@ -13,6 +15,31 @@ urlpatterns = [
         views.PageCreate.as_view(),
         name="create",
     ),
+    path(
+        "control/event/<str:organizer>/<str:event>/pages/export",
+        views.page_export,
+        name="export",
+    ),
+    path(
+        "control/event/<str:organizer>/<str:event>/pages/import",
+        views.PageImport.as_view(),
+        name="import",
+    ),
+    path(
+        "control/event/<str:organizer>/<str:event>/pages/settings",
+        views.PageSettings.as_view(),
+        name="settings",
+    ),
+    path(
+        "control/event/<str:organizer>/<str:event>/pages/images",
+        views.upload_page_image,
+        name="upload_image",
+    ),
+    path(
+        "control/event/<str:organizer>/<str:event>/pages/reorder",
+        views.reorder_pages,
+        name="reorder",
+    ),
     path(
         "control/event/<str:organizer>/<str:event>/pages/<int:page>/",
         views.PageUpdate.as_view(),
@@ -38,3 +65,5 @@ urlpatterns = [
 event_patterns = [
     path("page/<str:slug>/", views.ShowPageView.as_view(), name="show"),
 ]
+
+event_router.register("pages", PageViewSet, basename="pages")
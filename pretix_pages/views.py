@@ -1,27 +1,48 @@
-import bleach
-import lxml.html
+import hashlib
+import json
+from datetime import timedelta
+
 from django import forms
+from django.conf import settings
 from django.contrib import messages
-from django.core.files.base import ContentFile
-from django.core.files.storage import default_storage
-from django.db import transaction
-from django.db.models import Max
-from django.http import Http404, HttpResponseRedirect
+from django.db import IntegrityError, transaction
+from django.db.models import Max, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.http import (
+    Http404, HttpResponse, HttpResponseBadRequest, HttpResponseRedirect,
+    JsonResponse, StreamingHttpResponse,
+)
 from django.shortcuts import redirect
 from django.urls import reverse
-from django.utils.crypto import get_random_string
-from django.utils.safestring import mark_safe
-from django.utils.translation import gettext_lazy as _
-from django.views.generic import CreateView, ListView, TemplateView, UpdateView
-from pretix.base.forms import I18nModelForm
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+from django.utils.timezone import now
+from django.utils.translation import get_language, gettext_lazy as _
+from django.views.decorators.http import require_http_methods
+from django.views.generic import (
+    CreateView, FormView, ListView, TemplateView, UpdateView,
+)
+from pretix.base.forms import I18nModelForm, SettingsForm
 from pretix.control.permissions import (
     EventPermissionRequiredMixin, event_permission_required,
 )
+from pretix.control.views.event import EventSettingsFormView
 from pretix.helpers.compat import CompatDeleteView
 from pretix.multidomain.urlreverse import build_absolute_uri
-from urllib.request import urlopen
 
-from .models import Page
+from .archive import ArchiveError, export_pages, import_pages
+from .cache import (
+    cache_response, event_layout_version, get_cached_response,
+    get_page_manifest, invalidate_pages_cache, pages_version,
+    response_cache_timeout,
+)
+from .images import store_image, update_image_references
+from .metrics import measure
+from .models import Page, PageViewCount
+from .publish import unpublish_pages
+from .rendering import RENDER_VERSION, get_rendered_content, render_page
+from .sanitizer import clean_page_text, sanitize_page_content
+from .stats import count_page_view
 
 
 class PageList(EventPermissionRequiredMixin, ListView):
@@ -32,7 +53,47 @@ class PageList(EventPermissionRequiredMixin, ListView):
     permission = "can_change_event_settings"
 
     def get_queryset(self):
-        return Page.objects.filter(event=self.request.event)
+        views = PageViewCount.objects.filter(
+            page=OuterRef("pk"), date__gte=now().astimezone(self.request.event.timezone).date() - timedelta(days=30),
+        ).values("page").annotate(s=Sum("views")).values("s")
+        # The content of all locales can be large and is not shown in the list
+        return Page.objects.filter(event=self.request.event).defer("text").annotate(
+            recent_views=Coalesce(Subquery(views), 0),
+        )
+
+
+def set_page_order(event, ids):
+    """
+    Brings the pages with the given ``ids`` into the given order. The pages take over
+    the positions they occupied before, so ``ids`` can either contain all pages of
+    the event or only a subset, e.g. one page of the paginated list. The positions
+    of all pages are normalized on the way and written with a single query.
+
+    Moved pages count as modified, as ``last_modified`` is used to validate cached
+    copies of pages, e.g. by the ETags of the REST API and the static files.
+    """
+    pages = list(
+        event.page_set.select_for_update().only("id", "event", "position", "title", "last_modified").order_by("position", "title")
+    )
+    by_id = {p.pk: p for p in pages}
+    selected = set(ids)
+    if len(selected) != len(ids) or not selected <= by_id.keys():
+        raise Http404(_("Some of the provided object ids are invalid."))
+
+    slots = [i for i, p in enumerate(pages) if p.pk in selected]
+    for slot, pk in zip(slots, ids):
+        pages[slot] = by_id[pk]
+
+    changed = []
+    modified = now()
+    for i, p in enumerate(pages):
+        if p.position != i:
+            p.position = i
+            p.last_modified = modified
+            changed.append(p)
+    if changed:
+        Page.objects.bulk_update(changed, fields=["position", "last_modified"])
+        invalidate_pages_cache(event)
 
 
 def page_move(request, page, up=True):
@@ -41,24 +102,18 @@ def page_move(request, page, up=True):
     page_move_down. It takes a page and a direction and then tries to bring
     all pages for this event in a new order.
     """
-    try:
-        page = request.event.page_set.get(id=page)
-    except Page.DoesNotExist:
+    ids = list(request.event.page_set.order_by("position", "title").values_list("id", flat=True))
+    if page not in ids:
         raise Http404(_("The requested page does not exist."))
-    pages = list(request.event.page_set.order_by("position", "title"))
 
-    index = pages.index(page)
+    index = ids.index(page)
     if index != 0 and up:
-        pages[index - 1], pages[index] = pages[index], pages[index - 1]
-    elif index != len(pages) - 1 and not up:
-        pages[index + 1], pages[index] = pages[index], pages[index + 1]
+        ids[index - 1], ids[index] = ids[index], ids[index - 1]
+    elif index != len(ids) - 1 and not up:
+        ids[index + 1], ids[index] = ids[index], ids[index + 1]
 
-    for i, p in enumerate(pages):
-        if p.position != i:
-            p.position = i
-            p.save()
-
-    request.event.cache.clear()
+    with transaction.atomic():
+        set_page_order(request.event, ids)
     messages.success(request, _("The order of pages has been updated."))
 
 
@@ -82,6 +137,148 @@ def page_move_down(request, organizer, event, page):
     )
 
 
+@transaction.atomic
+@event_permission_required("can_change_event_settings")
+@require_http_methods(["POST"])
+def reorder_pages(request, organizer, event):
+    try:
+        ids = json.loads(request.body)["ids"]
+        ids = [int(i) for i in ids]
+    except (ValueError, TypeError, KeyError):
+        return HttpResponseBadRequest("expected JSON: {ids:[]}")
+
+    set_page_order(request.event, ids)
+    return HttpResponse()
+
+
+@event_permission_required("can_change_event_settings")
+def page_export(request, organizer, event):
+    response = StreamingHttpResponse(export_pages([request.event]), content_type="application/zip")
+    response["Content-Disposition"] = 'attachment; filename="pages-{}-{}.zip"'.format(
+        request.event.organizer.slug, request.event.slug
+    )
+    return response
+
+
+@event_permission_required("can_change_event_settings")
+@require_http_methods(["POST"])
+def upload_page_image(request, organizer, event):
+    """
+    Stores an image inserted into the editor, so it is not embedded into the content
+    of the page and does not need to be sent with every save.
+    """
+    f = request.FILES.get("image")
+    if f is None:
+        return JsonResponse({"error": str(_("No image has been uploaded."))}, status=400)
+    if f.size > settings.FILE_UPLOAD_MAX_SIZE_IMAGE:
+        return JsonResponse({"error": str(_("The image is too large."))}, status=400)
+    try:
+        url = store_image(request.organizer, f)["src"]
+    except ValueError:
+        return JsonResponse({"error": str(_("The file is not a supported image."))}, status=400)
+    return JsonResponse({"url": url})
+
+
+class PageImportForm(forms.Form):
+    archive = forms.FileField(
+        label=_("Archive"),
+        help_text=_("A ZIP file exported from the page list of any event."),
+    )
+    events = forms.ModelMultipleChoiceField(
+        queryset=None,
+        label=_("Events"),
+        help_text=_(
+            "Pages with the same URL are updated in all selected events, all other "
+            "pages are created."
+        ),
+        widget=forms.CheckboxSelectMultiple,
+    )
+
+    def __init__(self, *args, **kwargs):
+        self.event = kwargs.pop("event")
+        events = kwargs.pop("events")
+        super().__init__(*args, **kwargs)
+        self.fields["events"].queryset = events
+        self.fields["events"].initial = [self.event]
+
+
+class PageImport(EventPermissionRequiredMixin, FormView):
+    form_class = PageImportForm
+    template_name = "pretix_pages/import.html"
+    permission = "can_change_event_settings"
+
+    def get_form_kwargs(self):
+        kwargs = super().get_form_kwargs()
+        kwargs["event"] = self.request.event
+        kwargs["events"] = self.request.user.get_events_with_permission(
+            "can_change_event_settings", request=self.request
+        ).filter(
+            organizer=self.request.organizer, plugins__contains="pretix_pages"
+        ).select_related("organizer").order_by("-date_from")
+        return kwargs
+
+    def form_valid(self, form):
+        try:
+            counts = import_pages(
+                form.cleaned_data["archive"], form.cleaned_data["events"], user=self.request.user
+            )
+        except ArchiveError as e:
+            form.add_error("archive", str(e))
+            return self.form_invalid(form)
+        messages.success(
+            self.request,
+            _("{pages} pages have been imported into {events} events.").format(
+                pages=sum(counts.values()), events=len(counts)
+            ),
+        )
+        return redirect(
+            "plugins:pretix_pages:index",
+            organizer=self.request.event.organizer.slug,
+            event=self.request.event.slug,
+        )
+
+
+class PageSettingsForm(SettingsForm):
+    pages_publish_static = forms.BooleanField(
+        label=_("Publish pages as static files"),
+        help_text=_(
+            "All pages are additionally stored as static HTML files, including the layout of your "
+            "event, which can be served without any load on the ticket shop."
+        ),
+        required=False,
+    )
+    pages_static_links = forms.BooleanField(
+        label=_("Link to the static files"),
+        help_text=_(
+            "Links in the footer, on the front page and in the checkout point to the static files "
+            "instead of the pages in the ticket shop."
+        ),
+        required=False,
+    )
+
+
+class PageSettings(EventSettingsFormView):
+    form_class = PageSettingsForm
+    template_name = "pretix_pages/settings.html"
+    permission = "can_change_event_settings"
+
+    def get_success_url(self) -> str:
+        return reverse(
+            "plugins:pretix_pages:settings",
+            kwargs={
+                "organizer": self.request.event.organizer.slug,
+                "event": self.request.event.slug,
+            },
+        )
+
+    def form_success(self):
+        if not self.request.event.settings.pages_publish_static:
+            unpublish_pages(self.request.event)
+        # Cached responses contain the links, and the cache is warmed by the same task
+        # that publishes the pages
+        invalidate_pages_cache(self.request.event)
+
+
 class PageForm(I18nModelForm):
 
     def __init__(self, *args, **kwargs):
@@ -108,36 +305,8 @@ class PageForm(I18nModelForm):
             )
         return slug
 
-    mimes = {
-        "image/gif": "gif",
-        "image/jpeg": "jpg",
-        "image/png": "png",
-        "image/webp": "webp",
-    }
-
     def clean_text(self):
-        t = self.cleaned_data["text"]
-        for locale, html in t.data.items():
-            etrees = lxml.html.fragments_fromstring(html)
-            t.data[locale] = ""
-            for etree in etrees:
-                # Find all data:-based image URLs, store them to CDN and replace the image node
-                for image in etree.xpath("//img"):
-                    original_image_src = image.attrib["src"]
-                    if original_image_src.startswith("data:"):
-                        ftype = original_image_src.split(";")[0][5:]
-                        if ftype in self.mimes:
-                            with urlopen(original_image_src) as response:
-                                cfile = ContentFile(response.read())
-                                nonce = get_random_string(length=32)
-                                name = "pub/{}/pages/img/{}.{}".format(
-                                    self.event.organizer.slug, nonce, self.mimes[ftype]
-                                )
-                                stored_name = default_storage.save(name, cfile)
-                                stored_url = default_storage.url(stored_name)
-                                image.attrib["src"] = stored_url
-                t.data[locale] += lxml.html.tostring(etree).decode()
-        return t
+        return clean_page_text(self.cleaned_data["text"], self.event.organizer)
 
 
 class PageEditForm(PageForm):
@@ -176,7 +345,7 @@ class PageDelete(EventPermissionRequiredMixin, PageDetailMixin, CompatDeleteView
         self.object.log_action("pretix_pages.page.deleted", user=self.request.user)
         self.object.delete()
         messages.success(request, _("The selected page has been deleted."))
-        self.request.event.cache.clear()
+        invalidate_pages_cache(self.request.event)
         return HttpResponseRedirect(self.get_success_url())
 
 
@@ -208,7 +377,7 @@ class PageUpdate(
         )
 
     def get_context_data(self, **kwargs):
-        ctx = super().get_context_data()
+        ctx = super().get_context_data(**kwargs)
         ctx["locales"] = []
         ctx["url"] = build_absolute_uri(
             self.request.event,
@@ -219,7 +388,7 @@ class PageUpdate(
         )
 
         for lng in self.request.event.settings.locales:
-            localized_text = bleach_page_content(
+            localized_text = sanitize_page_content(
                 self.object.text.data[lng]
                 if self.object.text is not None
                 and (isinstance(self.object.text.data, dict))
@@ -238,8 +407,11 @@ class PageUpdate(
                 user=self.request.user,
                 data={k: form.cleaned_data.get(k) for k in form.changed_data},
             )
-        self.request.event.cache.clear()
-        return super().form_valid(form)
+        invalidate_pages_cache(self.request.event)
+        ret = super().form_valid(form)
+        render_page(self.object, self.request.event.settings.locales, sanitized=True)
+        update_image_references([self.object])
+        return ret
 
     def form_invalid(self, form):
         messages.error(
@@ -255,7 +427,7 @@ class PageCreate(EventPermissionRequiredMixin, PageEditorMixin, CreateView):
     permission = "can_change_event_settings"
 
     def get_context_data(self, **kwargs):
-        ctx = super().get_context_data()
+        ctx = super().get_context_data(**kwargs)
         ctx["locales"] = [
             (locale, "") for locale in self.request.event.settings.locales
         ]
@@ -277,14 +449,22 @@ class PageCreate(EventPermissionRequiredMixin, PageEditorMixin, CreateView):
         form.instance.position = (
             self.request.event.page_set.aggregate(p=Max("position"))["p"] or 0
         ) + 1
+        try:
+            with transaction.atomic():
+                ret = super().form_valid(form)
+        except IntegrityError:
+            # Another page with the same slug has been created since the form was validated
+            form.add_error("slug", _("You already have a page on that URL."))
+            return self.form_invalid(form)
         messages.success(self.request, _("The new page has been created."))
-        ret = super().form_valid(form)
         form.instance.log_action(
             "pretix_pages.page.added",
             data=dict(form.cleaned_data),
             user=self.request.user,
         )
-        self.request.event.cache.clear()
+        render_page(form.instance, self.request.event.settings.locales, sanitized=True)
+        update_image_references([form.instance], created=True)
+        invalidate_pages_cache(self.request.event)
         return ret
 
     def form_invalid(self, form):
@@ -298,29 +478,99 @@ class ShowPageView(TemplateView):
     template_name = "pretix_pages/show.html"
 
     def get_page(self):
+        """
+        Looks up the page in the manifest shared with the presale signal receivers,
+        which is usually kept in memory, so no database query is needed to answer
+        conditional requests. The content is served from the render store for the
+        requested locale only and is only loaded if it has not been rendered yet.
+        """
+        for entry in get_page_manifest(self.request.event):
+            if entry["slug"] == self.kwargs["slug"]:
+                page = Page.from_db(
+                    None, ["id", "event_id", "slug", "title", "last_modified"],
+                    [entry["id"], self.request.event.pk, entry["slug"], entry["title"], entry["last_modified"]],
+                )
+                page.event = self.request.event
+                return page
         try:
-            return Page.objects.get(event=self.request.event, slug=self.kwargs["slug"])
+            # Pages created since the manifest has been built
+            return Page.objects.defer("text").get(event=self.request.event, slug=self.kwargs["slug"])
         except Page.DoesNotExist:
             raise Http404(_("The requested page does not exist."))
 
+    def get_validators(self, page):
+        """
+        Returns the ETag and the modification timestamp of the response for ``page``.
+        Besides the page itself, the response depends on the language, the layout of
+        the event, the links to the other pages in the footer and the logged-in user
+        or customer, so they are included as well.
+        """
+        layout_version = event_layout_version(self.request.event)
+        version = pages_version(self.request.event)
+        customer = getattr(self.request, "customer", None)
+        etag = hashlib.sha1(
+            ":".join(
+                str(v) for v in (
+                    page.pk,
+                    page.last_modified.timestamp(),
+                    get_language(),
+                    RENDER_VERSION,
+                    layout_version,
+                    version,
+                    self.request.user.pk if self.request.user.is_authenticated else "",
+                    customer.pk if customer else "",
+                )
+            ).encode()
+        ).hexdigest()
+        last_modified = max(int(page.last_modified.timestamp()), layout_version, version)
+        return '"{}"'.format(etag), last_modified
+
+    def response_cacheable(self):
+        """
+        Only responses to anonymous visitors without pending messages are the same
+        for everyone and may be shared through the response cache and CDNs. The
+        query string is not part of the cache key, but pretix includes it in the
+        page, e.g. in the login form for customer accounts.
+        """
+        return (
+            response_cache_timeout() > 0
+            and not self.request.META.get("QUERY_STRING")
+            and not self.request.user.is_authenticated
+            and not getattr(self.request, "customer", None)
+            and not len(messages.get_messages(self.request))
+        )
+
+    def get(self, request, *args, **kwargs):
+        self.page = self.get_page()
+        if not getattr(request, "pages_publish", False):
+            count_page_view(request.event, self.page, get_language())
+        etag, last_modified = self.get_validators(self.page)
+        cacheable = self.response_cacheable()
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None and cacheable:
+            response = get_cached_response(request, etag.strip('"'))
+        if response is None:
+            with measure("show_page"):
+                response = super().get(request, *args, **kwargs)
+                response.render()
+            if cacheable:
+                response = cache_response(request, etag.strip('"'), response)
+        response["ETag"] = etag
+        response["Last-Modified"] = http_date(last_modified)
+        if cacheable:
+            # Shared caches may keep the page, browsers check with us every time
+            patch_cache_control(response, public=True, max_age=0, s_maxage=response_cache_timeout())
+        else:
+            # Allow browsers to keep the page, but make them check with us every time
+            patch_cache_control(response, private=True, no_cache=True)
+        return response
+
     def get_context_data(self, **kwargs):
         ctx = super().get_context_data()
-        page = self.get_page()
-        ctx["page"] = page
-        ctx["content"] = bleach_page_content(str(page.text))
+        ctx["page"] = self.page
+        try:
+            ctx["content"] = get_rendered_content(self.page, get_language())
+        except Page.DoesNotExist:
+            # Deleted since the manifest has been built
+            raise Http404(_("The requested page does not exist."))
         return ctx
-
-
-def bleach_page_content(text):
-    attributes = dict(bleach.ALLOWED_ATTRIBUTES)
-    attributes["a"] = ["href", "title", "target"]
-    attributes["p"] = ["class"]
-    attributes["li"] = ["class"]
-    attributes["img"] = ["src"]
-
-    return mark_safe(bleach.clean(
-        str(text),
-        tags=bleach.ALLOWED_TAGS | {"img", "p", "br", "s", "sup", "sub", "u", "h3", "h4", "h5", "h6"},
-        attributes=attributes,
-        protocols=bleach.ALLOWED_PROTOCOLS | {"data"},
-    ))
@@ -0,0 +1,110 @@
+import base64
+import datetime
+from io import BytesIO
+
+import pytest
+from django.core.cache import caches
+from django.test import override_settings
+from django.utils.timezone import now
+from django_scopes import scopes_disabled
+from i18nfield.strings import LazyI18nString
+from PIL import Image
+from pretix.base.models import Event, Organizer, Team, User
+from pretix_pages.cache import local_manifests
+from pretix_pages.models import Page
+
+LOCALES = ["en", "de", "fr"]
+
+
+def png_data_url(width, height):
+    """
+    Returns a PNG image of the given size with some noise, so it does not compress
+    unrealistically well, as a ``data:`` URL.
+    """
+    im = Image.effect_noise((width, height), 64).convert("RGB")
+    buf = BytesIO()
+    im.save(buf, format="PNG")
+    return "data:image/png;base64," + base64.b64encode(buf.getvalue()).decode()
+
+
+@pytest.fixture(autouse=True)
+def locmem_cache():
+    # The test settings of pretix use a dummy cache, which would hide everything the
+    # caching of this plugin does. This needs to run before any event is created, as
+    # events keep a reference to the cache.
+    with override_settings(CACHES={
+        "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "pretix_pages"},
+    }):
+        caches["default"].clear()
+        local_manifests.clear()
+        yield
+        caches["default"].clear()
+        local_manifests.clear()
+
+
+@pytest.fixture(autouse=True)
+def media_root(settings, tmp_path):
+    settings.MEDIA_ROOT = str(tmp_path)
+
+
+@pytest.fixture
+def organizer(django_capture_on_commit_callbacks):
+    # Settings changed in an open transaction are always read from the database, so
+    # act like the transaction had been committed
+    with django_capture_on_commit_callbacks(execute=True):
+        return Organizer.objects.create(name="Dummy", slug="dummy")
+
+
+@pytest.fixture
+def event(organizer, django_capture_on_commit_callbacks):
+    event = Event.objects.create(
+        organizer=organizer, name="Dummy", slug="dummy",
+        date_from=now() + datetime.timedelta(days=10), live=True,
+        plugins="pretix_pages",
+    )
+    with django_capture_on_commit_callbacks(execute=True):
+        event.settings.locales = LOCALES
+    # In requests, the settings are always loaded before this plugin is involved
+    event.settings.freeze()
+    return event
+
+
+@pytest.fixture
+def user(organizer):
+    user = User.objects.create_user("dummy@dummy.dummy", "dummy")
+    team = Team.objects.create(organizer=organizer, all_events=True, all_event_permissions=True)
+    team.members.add(user)
+    return user
+
+
+@pytest.fixture
+def admin_client(client, user):
+    client.login(email="dummy@dummy.dummy", password="dummy")
+    return client
+
+
+def make_pages(event, count, **kwargs):
+    with scopes_disabled():
+        return Page.objects.bulk_create([
+            Page(
+                event=event,
+                slug="page-{}".format(i),
+                position=i,
+                title=LazyI18nString({locale: "Page {} ({})".format(i, locale) for locale in LOCALES}),
+                text=LazyI18nString({
+                    locale: "<h3>Page {}</h3><p>Some <strong>text</strong> with a <a href=\"https://pretix.eu\">link</a>.</p>"
+                            "<ul><li>One</li><li>Two</li></ul>".format(i) * 10
+                    for locale in LOCALES
+                }),
+                link_in_footer=i % 2 == 0,
+                link_on_frontpage=i % 3 == 0,
+                require_confirmation=i == 1,
+                **kwargs,
+            )
+            for i in range(count)
+        ])
+
+
+@pytest.fixture
+def pages(event):
+    return make_pages(event, 50)
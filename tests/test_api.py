@@ -0,0 +1,167 @@
+import json
+
+import pytest
+from django_scopes import scopes_disabled
+from pretix.base.models import Team
+from pretix_pages.models import Page, PageRender
+from rest_framework.test import APIClient
+
+from .conftest import LOCALES
+from .test_queries import assert_plugin_queries
+
+URL = "/api/v1/organizers/dummy/events/dummy/pages/"
+
+
+@pytest.fixture
+def api_client(organizer):
+    team = Team.objects.create(organizer=organizer, all_events=True, all_event_permissions=True)
+    token = team.tokens.create(name="Test")
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION="Token " + token.token)
+    return client
+
+
+@pytest.mark.django_db
+def test_etag_changes_after_reorder(event, pages, api_client, admin_client):
+    etag = api_client.get(URL + "page-0/")["ETag"]
+    list_etag = api_client.get(URL)["ETag"]
+
+    admin_client.post(
+        "/control/event/dummy/dummy/pages/reorder",
+        json.dumps({"ids": [p.pk for p in reversed(pages)]}),
+        content_type="application/json",
+    )
+
+    response = api_client.get(URL + "page-0/", HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200
+    assert response.data["position"] == 49
+    assert response["ETag"] != etag
+    assert api_client.get(URL, HTTP_IF_NONE_MATCH=list_etag).status_code == 200
+    response = api_client.patch(URL + "page-0/", {"title": {"en": "Changed"}}, format="json", HTTP_IF_MATCH=etag)
+    assert response.status_code == 412
+
+
+@pytest.mark.django_db
+def test_list(event, pages, api_client):
+    with assert_plugin_queries(3):  # aggregate for the ETag, count, page of results
+        response = api_client.get(URL + "?fields=slug,title")
+    assert response.status_code == 200
+    assert response.data["count"] == 50
+    assert response.data["results"][0] == {"slug": "page-0", "title": {locale: "Page 0 ({})".format(locale) for locale in LOCALES}}
+
+    with assert_plugin_queries(3, load_text=True):
+        response = api_client.get(URL, HTTP_IF_NONE_MATCH=response["ETag"])
+    assert response.status_code == 200  # Different fields, different ETag
+    etag = response["ETag"]
+    with assert_plugin_queries(1):  # aggregate for the ETag
+        assert api_client.get(URL, HTTP_IF_NONE_MATCH=etag).status_code == 304
+
+
+@pytest.mark.django_db
+def test_retrieve(event, pages, api_client):
+    response = api_client.get(URL + "page-3/")
+    assert response.status_code == 200
+    assert response.data["text"]["en"].startswith("<h3>Page 3</h3>")
+    assert response["ETag"] == response.data["etag"]
+    assert api_client.get(URL + "page-3/", HTTP_IF_NONE_MATCH=response["ETag"]).status_code == 304
+    assert api_client.get(URL + "missing/").status_code == 404
+
+
+@pytest.mark.django_db
+def test_create(event, api_client):
+    response = api_client.post(URL, {
+        "slug": "new", "title": {"en": "New"}, "text": {"en": "<p>New<script>alert(1)</script></p>"},
+    }, format="json")
+    assert response.status_code == 201
+    with scopes_disabled():
+        page = Page.objects.get(event=event, slug="new")
+        assert page.text.localize("en") == "<p>New</p>"
+        assert PageRender.objects.filter(page=page).count() == len(LOCALES)
+    assert page.position == 1
+
+    response = api_client.post(URL, {"slug": "new", "title": {"en": "New"}, "text": {"en": ""}}, format="json")
+    assert response.status_code == 400
+
+    response = api_client.post(URL, {"slug": "last", "title": {"en": "Last"}, "text": {"en": "<p>Last</p>"}}, format="json")
+    assert response.data["position"] == 2
+    response = api_client.post(URL, {
+        "slug": "first", "position": 0, "title": {"en": "First"}, "text": {"en": "<p>First</p>"},
+    }, format="json")
+    assert response.data["position"] == 0
+
+
+@pytest.mark.django_db
+def test_update(event, pages, api_client):
+    etag = api_client.get(URL + "page-3/")["ETag"]
+    response = api_client.patch(URL + "page-3/", {"title": {"en": "Changed"}}, format="json", HTTP_IF_MATCH=etag)
+    assert response.status_code == 200
+    assert response["ETag"] != etag
+    with scopes_disabled():
+        assert Page.objects.get(event=event, slug="page-3").title.localize("en") == "Changed"
+
+    # The page has been changed since the ETag has been retrieved
+    response = api_client.patch(URL + "page-3/", {"title": {"en": "Lost"}}, format="json", HTTP_IF_MATCH=etag)
+    assert response.status_code == 412
+    response = api_client.patch(URL + "page-3/", {"slug": "other"}, format="json")
+    assert response.status_code == 400
+
+
+@pytest.mark.django_db
+def test_delete(event, pages, api_client):
+    etag = api_client.get(URL + "page-3/")["ETag"]
+    assert api_client.delete(URL + "page-3/", HTTP_IF_MATCH='"outdated"').status_code == 412
+    assert api_client.delete(URL + "page-3/", HTTP_IF_MATCH=etag).status_code == 204
+    with scopes_disabled():
+        assert not Page.objects.filter(event=event, slug="page-3").exists()
+
+
+@pytest.mark.django_db
+def test_bulk_upsert(event, pages, api_client):
+    payload = [
+        {"slug": "page-1", "title": {locale: "Page 1 ({})".format(locale) for locale in LOCALES}},
+        {"slug": "page-2", "title": {"en": "Changed"}},
+        {"slug": "new", "title": {"en": "New"}, "text": {"en": "<p>New</p>"}},
+    ]
+    # existing pages, slug check, position, insert, update, render delete, image references
+    with assert_plugin_queries(7, load_text=True):
+        response = api_client.post(URL + "bulk_upsert/", payload, format="json")
+    assert response.status_code == 200
+    assert [(r["slug"], r["status"]) for r in response.data] == [
+        ("page-1", "unchanged"), ("page-2", "updated"), ("new", "created"),
+    ]
+    assert response.data[1]["etag"] == api_client.get(URL + "page-2/")["ETag"]
+    # New pages are added at the end
+    assert api_client.get(URL + "new/").data["position"] == 50
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("payload", [
+    {"slug": "page"},
+    [{"slug": ["page"], "title": {"en": "Page"}}],
+    [{"slug": {"a": 1}}],
+    [{"title": {"en": "Page"}}],
+    [{"slug": "page", "title": {"en": "A"}}, {"slug": "page", "title": {"en": "B"}}],
+    ["page"],
+    [{"slug": "../page", "title": {"en": "Page"}}],
+])
+def test_bulk_upsert_invalid(event, pages, api_client, payload):
+    response = api_client.post(URL + "bulk_upsert/", payload, format="json")
+    assert response.status_code == 400
+    with scopes_disabled():
+        assert Page.objects.filter(event=event).count() == 50
+
+
+@pytest.mark.django_db
+def test_update_sanitizes_stored_content(event, api_client, client):
+    with scopes_disabled():
+        # Content stored before it was sanitized on save
+        Page.objects.create(
+            event=event, slug="legacy", title="Legacy", text="<p>Text<script>alert(1)</script><img src=x onerror=alert(1)></p>",
+        )
+    assert b"alert(1)" not in client.get("/dummy/dummy/page/legacy/").content
+
+    response = api_client.patch(URL + "legacy/", {"title": {"en": "Changed"}}, format="json")
+    assert response.status_code == 200
+    response = client.get("/dummy/dummy/page/legacy/")
+    assert b"Changed" in response.content
+    assert b"alert(1)" not in response.content
@@ -0,0 +1,172 @@
+import base64
+import hashlib
+import io
+import json
+import zipfile
+
+import pytest
+from django.core.files.storage import default_storage
+from django.core.management import CommandError, call_command
+from django.utils.timezone import now
+from django_scopes import scopes_disabled
+from i18nfield.strings import LazyI18nString
+from PIL import Image
+from pretix.base.models import Event
+from pretix_pages.archive import ArchiveError, import_pages
+from pretix_pages.models import Page, PageRender
+from pretix_pages.sanitizer import clean_page_text
+
+from .conftest import make_pages, png_data_url
+
+PNG = base64.b64decode(png_data_url(16, 16).split(",")[1])
+
+
+@pytest.fixture
+def other(organizer):
+    return Event.objects.create(
+        organizer=organizer, name="Other", slug="other", date_from=now(), plugins="pretix_pages",
+    )
+
+
+@pytest.fixture
+def image_page(event, organizer):
+    with scopes_disabled():
+        return Page.objects.create(
+            event=event, slug="image", title="Image", position=10,
+            text=clean_page_text(LazyI18nString({"en": "<p><img src=\"{}\"></p>".format(png_data_url(1200, 600))}), organizer),
+        )
+
+
+def make_archive(records, images=None):
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as zf:
+        zf.writestr("pages.jsonl", "".join(json.dumps(r) + "\n" for r in records))
+        for name, content in (images or {}).items():
+            zf.writestr("images/" + name, content)
+    buf.seek(0)
+    return buf
+
+
+def stored_files():
+    try:
+        return default_storage.listdir("pub/dummy/pages/img/")[1]
+    except FileNotFoundError:
+        return []
+
+
+@pytest.mark.django_db
+def test_export_import(event, other, image_page, admin_client):
+    make_pages(event, 3)
+    response = admin_client.get("/control/event/dummy/dummy/pages/export")
+    assert response.status_code == 200
+    archive = b"".join(response.streaming_content)
+    with zipfile.ZipFile(io.BytesIO(archive)) as zf:
+        assert "pretix-pages-image:" in zf.read("pages.jsonl").decode()
+        assert any(n.startswith("images/") for n in zf.namelist())
+
+    with scopes_disabled():
+        Page.objects.create(event=other, slug="page-1", title="Old", text="<p>Old</p>")
+    response = admin_client.post("/control/event/dummy/other/pages/import", {
+        "archive": io.BytesIO(archive), "events": [other.pk],
+    })
+    assert response.status_code == 302
+
+    with scopes_disabled():
+        assert Page.objects.filter(event=other).count() == 4
+        # Existing pages with the same slug are updated
+        updated = Page.objects.get(event=other, slug="page-1")
+        assert updated.title.localize("en") == "Page 1 (en)"
+        assert not PageRender.objects.filter(page=updated).exists()
+        copy = Page.objects.get(event=other, slug="image")
+    assert copy.position == 10
+    html = copy.text.localize("en")
+    assert "/pub/dummy/pages/img/" in html and "srcset=" in html
+    # The variants are created again from the largest one
+    paths = set(copy.image_references.values_list("path", flat=True))
+    assert len(paths) == 3 and all(default_storage.exists(p) for p in paths)
+
+
+@pytest.mark.django_db
+def test_export_import_commands(event, other, image_page, tmp_path):
+    make_pages(event, 3)
+    path = str(tmp_path / "pages.zip")
+    call_command("pages_export", "dummy", events=["dummy"], output=path)
+    call_command("pages_import", path, "dummy", events=["other"])
+    with scopes_disabled():
+        assert sorted(Page.objects.filter(event=other).values_list("slug", flat=True)) == [
+            "image", "page-0", "page-1", "page-2",
+        ]
+
+    with open(path, "wb") as f:
+        f.write(b"No archive")
+    with pytest.raises(CommandError):
+        call_command("pages_import", path, "dummy", events=["other"])
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("record", [
+    {"slug": "../page"},
+    {"slug": "page\n"},
+    {"slug": ""},
+    {"slug": ["page"]},
+    {"slug": "page", "position": "1"},
+    {"slug": "page", "position": True},
+    ["page"],
+])
+def test_import_invalid_pages(event, record):
+    with scopes_disabled():
+        with pytest.raises(ArchiveError):
+            import_pages(make_archive([record]), [event])
+        assert not Page.objects.exists()
+
+
+def image(format):
+    buf = io.BytesIO()
+    Image.new("RGB", (8, 8)).save(buf, format=format)
+    return buf.getvalue()
+
+
+HTML = b"<html><script>alert(document.cookie)</script></html>"
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("filename,content", [
+    # Content does not match the name
+    ("{}.png".format(hashlib.sha256(b"other").hexdigest()), PNG),
+    # Not an image
+    ("{}.png".format(hashlib.sha256(HTML).hexdigest()), HTML),
+    # Not the image type of the name
+    ("{}.png".format(hashlib.sha256(image("GIF")).hexdigest()), image("GIF")),
+    # Variants need to have the size of their name
+    ("{}-100x100.webp".format("0" * 64), image("WEBP")),
+])
+def test_import_invalid_images(event, filename, content):
+    archive = make_archive(
+        [{"slug": "page", "text": "<img src=\"pretix-pages-image:{}\">".format(filename)}], {filename: content},
+    )
+    with scopes_disabled():
+        with pytest.raises(ArchiveError):
+            import_pages(archive, [event])
+        assert not Page.objects.exists()
+    assert stored_files() == []
+
+
+@pytest.mark.django_db
+def test_import_never_stores_other_files(event):
+    digest = hashlib.sha256(HTML).hexdigest()
+    archive = make_archive(
+        [{"slug": "page", "text": "<img src=\"pretix-pages-image:{}.html\">".format(digest)}],
+        {digest + ".html": HTML},
+    )
+    with scopes_disabled():
+        import_pages(archive, [event])
+        assert "pretix-pages-image" not in Page.objects.get(slug="page").text.localize("en")
+    assert stored_files() == []
+
+
+@pytest.mark.django_db
+def test_import_missing_image(event):
+    archive = make_archive([{"slug": "page", "text": "<img src=\"pretix-pages-image:{}.png\">".format("0" * 64)}])
+    with scopes_disabled():
+        with pytest.raises(ArchiveError):
+            import_pages(archive, [event])
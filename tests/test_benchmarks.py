@@ -0,0 +1,201 @@
+"""
+Benchmarks for the expensive operations of this plugin. Run them with
+``make benchmark`` to store the results and ``make benchmark-compare`` to compare
+against the last stored run, see the README for details.
+
+In a regular test run, every benchmark is only executed once.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from urllib.request import urlopen
+
+import lxml.html
+import pytest
+from django.contrib.messages.storage.fallback import FallbackStorage
+from django.test import RequestFactory
+from django.utils.safestring import mark_safe
+from django_scopes import scope, scopes_disabled
+from pretix.base.models import Event
+from pretix_pages import signals, views
+from pretix_pages.models import Page
+from pretix_pages.sanitizer import sanitize_page_content
+
+from .conftest import LOCALES, make_pages, png_data_url
+
+pytest.importorskip("pytest_benchmark")
+
+
+def process_image_stub(src):
+    # What process_image() returns for images that are not embedded
+    return {"loading": "lazy"}
+
+
+CONTENT = (
+    "<h3>Terms of service</h3>"
+    "<p class=\"lead\">Some <strong>important</strong> text with a <a href=\"https://pretix.eu\" title=\"pretix\">link</a>"
+    " and <span style=\"color: red\">inline styles</span>.</p>"
+    "<ul><li>One</li><li class=\"ql-indent-1\">Two <em>items</em></li></ul>"
+    "<p><img src=\"https://example.org/image.png\"><script>alert(1)</script><a href=\"javascript:alert(1)\">x</a></p>"
+) * 50
+
+
+def previous_page_content(text):
+    """
+    The pipeline used up to version 1.6, for comparison: ``PageForm.clean_text``
+    parsed the content with lxml to find embedded images, and the result was passed
+    through bleach before it was shown.
+    """
+    bleach = pytest.importorskip("bleach")
+
+    html = ""
+    for etree in lxml.html.fragments_fromstring(text):
+        # Embedded images were stored here, CONTENT does not contain any
+        etree.xpath("//img")
+        html += lxml.html.tostring(etree).decode()
+
+    attributes = dict(bleach.ALLOWED_ATTRIBUTES)
+    attributes["a"] = ["href", "title", "target"]
+    attributes["p"] = ["class"]
+    attributes["li"] = ["class"]
+    attributes["img"] = ["src"]
+
+    return mark_safe(bleach.clean(
+        html,
+        tags=bleach.ALLOWED_TAGS | {"img", "p", "br", "s", "sup", "sub", "u", "h3", "h4", "h5", "h6"},
+        attributes=attributes,
+        protocols=bleach.ALLOWED_PROTOCOLS | {"data"},
+    ))
+
+
+@pytest.mark.benchmark(group="sanitize")
+def test_sanitize_page_content(benchmark):
+    # Like clean_page_text(), images are processed in the same pass
+    result = benchmark(sanitize_page_content, CONTENT, image_callback=process_image_stub)
+    assert "<script>" not in result and "javascript:" not in result
+
+
+@pytest.mark.benchmark(group="sanitize")
+def test_sanitize_page_content_previous(benchmark):
+    result = benchmark(previous_page_content, CONTENT)
+    assert "<script>" not in result
+
+
+@pytest.mark.django_db
+@pytest.mark.benchmark(group="clean_text")
+def test_clean_text_inline_images(benchmark, event, settings, tmp_path_factory):
+    photo = png_data_url(1800, 1200)
+    icon = png_data_url(64, 64)
+    data = {"title_0": "Page", "slug": "page"}
+    for i, locale in enumerate(LOCALES):
+        # Like pages created in the editor, every locale contains the same images
+        data["text_{}".format(i)] = "<p>{}</p><p><img src=\"{}\"> <img src=\"{}\"></p>".format(locale, photo, icon)
+
+    def setup():
+        # Every round needs to process the images from scratch
+        settings.MEDIA_ROOT = str(tmp_path_factory.mktemp("media"))
+
+    def clean():
+        with scope(organizer=event.organizer):
+            form = views.PageForm(data=data, event=event, locales=LOCALES)
+            assert form.is_valid(), form.errors
+        return form
+
+    form = benchmark.pedantic(clean, setup=setup, rounds=5)
+    assert "srcset" in form.cleaned_data["text"].localize("de")
+
+
+@pytest.mark.django_db
+@pytest.mark.benchmark(group="page_move")
+def test_page_move(benchmark, event, user):
+    pages = make_pages(event, 200)
+    factory = RequestFactory()
+
+    def move():
+        request = factory.get("/")
+        request.event = event
+        request.user = user
+        request.session = {}
+        request._messages = FallbackStorage(request)
+        with scope(organizer=event.organizer):
+            views.page_move(request, pages[100].pk, up=True)
+
+    benchmark(move)
+    with scopes_disabled():
+        assert Page.objects.filter(event=event, position__in=(99, 100)).count() == 2
+
+
+@pytest.mark.django_db
+@pytest.mark.benchmark(group="event_copy")
+def test_event_copy(benchmark, event, organizer):
+    make_pages(event, 100)
+    with scopes_disabled():
+        clone = Event.objects.create(
+            organizer=organizer, name="Clone", slug="clone", date_from=event.date_from, plugins="pretix_pages",
+        )
+
+    def setup():
+        with scopes_disabled():
+            Page.objects.filter(event=clone).delete()
+
+    def copy():
+        with scopes_disabled():
+            signals.event_copy_data_receiver(clone, other=event)
+
+    benchmark.pedantic(copy, setup=setup, rounds=20)
+    with scopes_disabled():
+        assert Page.objects.filter(event=clone).count() == 100
+
+
+@pytest.mark.django_db
+@pytest.mark.benchmark(group="show_page")
+@pytest.mark.parametrize("lookup", ["manifest", "database"])
+def test_show_page(benchmark, event, pages, client, lookup):
+    if lookup == "database":
+        # Pages created after the manifest has been built are looked up in the database,
+        # like all pages were before
+        client.get("/dummy/dummy/page/page-3/")
+        with scopes_disabled():
+            Page.objects.create(event=event, slug="new", title="New", text=CONTENT)
+        url = "/dummy/dummy/page/new/"
+    else:
+        url = "/dummy/dummy/page/page-3/"
+    client.get(url)
+
+    response = benchmark(client.get, url)
+    assert response.status_code == 200
+
+
+CONCURRENCY = 8
+REQUESTS = 200
+
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.benchmark(group="show_page_concurrent")
+@pytest.mark.parametrize("lookup", ["manifest", "database"])
+def test_show_page_concurrent(benchmark, live_server, settings, event, pages, lookup):
+    """
+    Serves ``REQUESTS`` requests from ``CONCURRENCY`` clients at once through a
+    threaded server outside of the test transaction, so the requests compete for the
+    database and the Python interpreter like they would in production.
+    """
+    settings.SITE_URL = live_server.url
+    if lookup == "database":
+        urlopen(live_server.url + "/dummy/dummy/page/page-3/").read()
+        with scopes_disabled():
+            Page.objects.create(event=event, slug="new", title="New", text=CONTENT)
+        url = live_server.url + "/dummy/dummy/page/new/"
+    else:
+        url = live_server.url + "/dummy/dummy/page/page-3/"
+    # Store the render first, as concurrent first renders lock the table in SQLite
+    urlopen(url).read()
+
+    def get(url):
+        with urlopen(url) as response:
+            response.read()
+            return response.status
+
+    def load():
+        with ThreadPoolExecutor(CONCURRENCY) as pool:
+            return list(pool.map(get, [url] * REQUESTS))
+
+    statuses = benchmark.pedantic(load, rounds=5, warmup_rounds=1)
+    assert statuses == [200] * REQUESTS
@@ -0,0 +1,164 @@
+import base64
+import datetime
+import io
+import os
+import time
+
+import pytest
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.utils.timezone import now
+from django_scopes import scopes_disabled
+from i18nfield.strings import LazyI18nString
+from pretix.base.models import Event, Organizer, Team
+from pretix_pages import signals
+from pretix_pages.archive import export_pages, import_pages
+from pretix_pages.images import (
+    image_references, store_image, update_image_references,
+)
+from pretix_pages.models import Page, PageImageUpload, PageRender
+from pretix_pages.sanitizer import clean_page_text
+from rest_framework.test import APIClient
+
+from .conftest import png_data_url
+
+SVG = "data:image/svg+xml;base64,PHN2ZyB4bWxucz0iaHR0cDovL3d3dy53My5vcmcvMjAwMC9zdmciLz4="
+
+
+@pytest.mark.django_db
+def test_extract_images(event):
+    photo = png_data_url(64, 64)
+    with scopes_disabled():
+        legacy = Page.objects.create(event=event, slug="legacy", title="Legacy", text=LazyI18nString({
+            "en": "<p><img src=\"{}\"></p>".format(photo),
+            "de": "<p><img src=\"{}\"><img src=\"{}\"></p>".format(photo, SVG),
+        }))
+        plain = Page.objects.create(event=event, slug="plain", title="Plain", text="<p>Text</p>")
+
+    call_command("pages_extract_images", batch_size=1)
+
+    with scopes_disabled():
+        legacy.refresh_from_db()
+        assert "data:image/png" not in str(legacy.text.data)
+        assert "/pub/dummy/pages/img/" in legacy.text.localize("en")
+        # SVG images stay embedded, see process_image()
+        assert SVG in legacy.text.localize("de")
+        assert "/pub/dummy/pages/img/" in PageRender.objects.get(page=legacy, locale="en").content
+        assert not PageRender.objects.filter(page=plain).exists()
+        assert legacy.image_references.filter(path__startswith="pub/dummy/pages/img/").exists()
+
+        last_modified = legacy.last_modified
+        call_command("pages_extract_images")
+        legacy.refresh_from_db()
+        assert legacy.last_modified == last_modified
+
+
+@pytest.mark.django_db
+def test_extract_images_start_after(event):
+    with scopes_disabled():
+        first, second = [
+            Page.objects.create(event=event, slug=slug, title=slug, text="<img src=\"{}\">".format(png_data_url(8, 8)))
+            for slug in ("first", "second")
+        ]
+
+    call_command("pages_extract_images", start_after=first.pk)
+
+    with scopes_disabled():
+        first.refresh_from_db()
+        second.refresh_from_db()
+    assert "data:image/png" in first.text.localize("en")
+    assert "data:image/png" not in second.text.localize("en")
+
+
+def age(name, days):
+    timestamp = time.time() - days * 86400
+    os.utime(default_storage.path(name), (timestamp, timestamp))
+    PageImageUpload.objects.filter(path=name).update(last_used=now() - datetime.timedelta(days=days))
+
+
+@pytest.mark.django_db
+def test_gc_images(event, organizer, capsys):
+    with scopes_disabled():
+        page = Page.objects.create(event=event, slug="page", title="Page", text="<p>Text</p>")
+        page.text = clean_page_text(LazyI18nString("<img src=\"{}\">".format(png_data_url(8, 8))), organizer)
+        page.save()
+        update_image_references([page])
+        used = page.image_references.get().path
+    unused, recent = [
+        store_image(organizer, ContentFile(base64.b64decode(png_data_url(8, 8).split(",")[1])))["src"][
+            len(default_storage.url("")):
+        ]
+        for i in range(2)
+    ]
+    for name in (used, unused):
+        age(name, 30)
+
+    call_command("pages_gc_images", dry_run=True)
+    assert capsys.readouterr().out.split() == [unused]
+    assert default_storage.exists(unused)
+
+    call_command("pages_gc_images", batch_size=1)
+    assert not default_storage.exists(unused)
+    assert default_storage.exists(used)
+    # Images uploaded recently may be used by a page that has not been saved yet
+    assert default_storage.exists(recent)
+
+    with scopes_disabled():
+        page.delete()
+    call_command("pages_gc_images")
+    assert not default_storage.exists(used)
+
+
+@pytest.mark.django_db
+def test_gc_images_keeps_images_uploaded_again(event, organizer):
+    content = base64.b64decode(png_data_url(8, 8).split(",")[1])
+    name = store_image(organizer, ContentFile(content))["src"][len(default_storage.url("")):]
+    age(name, 30)
+
+    # The image is uploaded again for a page that has not been saved yet
+    assert store_image(organizer, ContentFile(content))["src"].endswith(name)
+    call_command("pages_gc_images")
+    assert default_storage.exists(name)
+
+
+@pytest.mark.django_db
+def test_gc_images_keeps_referenced_images(event, organizer, admin_client):
+    def img(width):
+        return "<p><img src=\"{}\"></p>".format(png_data_url(width, 8))
+
+    admin_client.post("/control/event/dummy/dummy/pages/create", {"title_0": "Form", "slug": "form", "text_0": img(10)})
+    team = Team.objects.create(organizer=organizer, all_events=True, all_event_permissions=True)
+    api_client = APIClient()
+    api_client.credentials(HTTP_AUTHORIZATION="Token " + team.tokens.create(name="Test").token)
+    api_client.post(
+        "/api/v1/organizers/dummy/events/dummy/pages/",
+        {"slug": "api", "title": {"en": "API"}, "text": {"en": img(11)}}, format="json",
+    )
+    api_client.post(
+        "/api/v1/organizers/dummy/events/dummy/pages/bulk_upsert/",
+        [{"slug": "bulk", "title": {"en": "Bulk"}, "text": {"en": img(12)}}], format="json",
+    )
+    with scopes_disabled():
+        Page.objects.create(event=event, slug="legacy", title="Legacy", text=img(13))
+    call_command("pages_extract_images")
+    with scopes_disabled():
+        other = Organizer.objects.create(name="Other", slug="other")
+        clone = Event.objects.create(
+            organizer=other, name="Clone", slug="clone", date_from=event.date_from, plugins="pretix_pages",
+        )
+        signals.event_copy_data_receiver(clone, other=event)
+        archive = io.BytesIO(b"".join(export_pages([event])))
+        import_pages(archive, [clone])
+
+    for folder in ("pub/dummy/pages/img/", "pub/other/pages/img/"):
+        for filename in default_storage.listdir(folder)[1]:
+            age(folder + filename, 30)
+    call_command("pages_gc_images", grace_days=0)
+
+    with scopes_disabled():
+        pages = list(Page.objects.all())
+    assert len(pages) == 8  # the import updates the copied pages
+    referenced = set().union(*(image_references(p.text) for p in pages))
+    assert len(referenced) >= 5
+    assert all(default_storage.exists(path) for path in referenced)
@@ -0,0 +1,149 @@
+import base64
+import re
+from io import BytesIO
+
+import pytest
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django_scopes import scopes_disabled
+from i18nfield.strings import LazyI18nString
+from PIL import Image
+from pretix.base.models import Event, Organizer
+from pretix_pages import images, signals
+from pretix_pages.images import (
+    IMAGE_FILENAME, store_image, update_image_references,
+)
+from pretix_pages.models import Page
+from pretix_pages.sanitizer import clean_page_text
+
+from .conftest import png_data_url
+
+URL = "/control/event/dummy/dummy/pages/images"
+
+
+def upload(client, name, content):
+    return client.post(URL, {"image": SimpleUploadedFile(name, content)})
+
+
+def stored(url):
+    return default_storage.exists(url[len(default_storage.url("")):])
+
+
+@pytest.mark.django_db
+def test_upload_image(event, admin_client):
+    png = base64.b64decode(png_data_url(1200, 600).split(",")[1])
+    response = upload(admin_client, "photo.png", png)
+    assert response.status_code == 200
+    url = response.json()["url"]
+    assert "/pub/dummy/pages/img/" in url and url.endswith("-1200x600.webp")
+    assert stored(url)
+
+    # The same image is stored under the same name
+    assert upload(admin_client, "copy.png", png).json()["url"] == url
+
+
+@pytest.mark.django_db
+def test_upload_animation(event, admin_client):
+    frames = [Image.new("RGB", (8, 8), color) for color in ("red", "blue")]
+    buf = BytesIO()
+    frames[0].save(buf, format="GIF", save_all=True, append_images=frames[1:])
+    response = upload(admin_client, "animation.gif", buf.getvalue())
+    assert response.status_code == 200
+    url = response.json()["url"]
+    # Animations are stored as they are
+    assert url.endswith(".gif")
+    assert stored(url)
+
+
+@pytest.mark.django_db
+def test_upload_invalid(event, admin_client):
+    svg = b'<svg xmlns="http://www.w3.org/2000/svg"><script>alert(1)</script></svg>'
+    response = upload(admin_client, "image.svg", svg)
+    assert response.status_code == 400
+    assert "error" in response.json()
+    assert admin_client.post(URL).status_code == 400
+
+
+@pytest.mark.django_db
+def test_upload_requires_permission(event, client):
+    response = upload(client, "photo.png", base64.b64decode(png_data_url(8, 8).split(",")[1]))
+    assert response.status_code == 302
+    assert not default_storage.exists("pub/dummy/pages/img/")
+
+
+def references(page):
+    with scopes_disabled():
+        return set(page.image_references.values_list("path", flat=True))
+
+
+@pytest.mark.django_db
+def test_image_references(event, admin_client):
+    admin_client.post("/control/event/dummy/dummy/pages/create", {
+        "title_0": "Images", "slug": "images", "text_0": "<p><img src=\"{}\"></p>".format(png_data_url(1200, 600)),
+    })
+    with scopes_disabled():
+        page = Page.objects.get(slug="images")
+    paths = references(page)
+    # All variants are referenced through the srcset
+    assert len(paths) == 3
+    assert all(p.startswith("pub/dummy/pages/img/") and default_storage.exists(p) for p in paths)
+
+    admin_client.post("/control/event/dummy/dummy/pages/{}/".format(page.pk), {
+        "title_0": "Images", "text_0": "<p><img src=\"{}\"></p>".format(png_data_url(8, 8)),
+    })
+    new_paths = references(page)
+    assert len(new_paths) == 1 and not new_paths & paths
+
+
+@pytest.mark.django_db
+def test_image_references_copied(event, organizer):
+    with scopes_disabled():
+        page = Page.objects.create(event=event, slug="images", title="Images", text="<p>Text</p>")
+        page.text = clean_page_text(
+            LazyI18nString({"en": "<img src=\"{}\">".format(png_data_url(8, 8))}), organizer
+        )
+        page.save()
+        update_image_references([page])
+        other = Organizer.objects.create(name="Other", slug="other")
+        clone = Event.objects.create(
+            organizer=other, name="Clone", slug="clone", date_from=event.date_from, plugins="pretix_pages",
+        )
+        signals.event_copy_data_receiver(clone, other=event)
+        copy = Page.objects.get(event=clone)
+
+    # The copied images of the other organizer are referenced
+    path = references(copy).pop()
+    assert path.startswith("pub/other/pages/img/")
+    assert references(page) == {path.replace("/other/", "/dummy/")}
+
+
+class RacingStorage:
+    """
+    Lets the checks for existing files of ``pretix_pages.images`` fail, like if the
+    file has been stored by another process right after the check.
+    """
+
+    def exists(self, name):
+        return False
+
+    def __getattr__(self, name):
+        return getattr(default_storage, name)
+
+
+@pytest.mark.django_db
+def test_store_image_concurrently(event, organizer, monkeypatch):
+    png = base64.b64decode(png_data_url(1200, 600).split(",")[1])
+    src = store_image(organizer, ContentFile(png))["src"]
+    # Another process stores the same image between the check and the save
+    monkeypatch.setattr(images, "default_storage", RacingStorage())
+    assert store_image(organizer, ContentFile(png))["src"] == src
+    gif = base64.b64decode("R0lGODlhAQABAIAAAP///wAAACH5BAEAAAAALAAAAAABAAEAAAICRAEAOw==")
+    frames = [Image.new("RGB", (8, 8), color) for color in ("red", "blue")]
+    buf = BytesIO()
+    frames[0].save(buf, format="GIF", save_all=True, append_images=frames[1:])
+    for content in (buf.getvalue(), buf.getvalue(), gif, gif):
+        store_image(organizer, ContentFile(content))
+
+    files = default_storage.listdir("pub/dummy/pages/img/")[1]
+    assert all(re.fullmatch(IMAGE_FILENAME, f) for f in files), files
@@ -0,0 +1,73 @@
+import json
+import logging
+
+import pytest
+from django.utils import translation
+from pretix_pages import metrics, signals
+
+RECORDED = []
+
+
+class RecordingBackend(metrics.MetricsBackend):
+    def cache_access(self, cache, hit):
+        RECORDED.append(("cache", cache, hit))
+
+    def operation(self, operation, duration, queries):
+        RECORDED.append(("operation", operation, queries))
+
+
+@pytest.fixture
+def recorded(monkeypatch):
+    monkeypatch.setenv("PRETIX_PRETIX_PAGES_METRICS", "tests.test_metrics.RecordingBackend")
+    RECORDED.clear()
+    yield RECORDED
+    RECORDED.clear()
+
+
+@pytest.mark.django_db
+def test_receivers(event, pages, recorded):
+    with translation.override("de"):
+        signals.footer_link_pages(event)
+        signals.footer_link_pages(event)
+    assert recorded == [
+        ("cache", "manifest_local", False),
+        ("cache", "manifest", False),
+        ("operation", "build_manifest", 3),
+        ("operation", "footer_links", 3),
+        ("cache", "manifest_local", True),
+        ("operation", "footer_links", 0),
+    ]
+
+
+@pytest.mark.django_db
+def test_show_page(event, pages, client, recorded):
+    client.get("/dummy/dummy/page/page-3/")
+    assert ("cache", "render", False) in recorded
+    assert [r[1] for r in recorded if r[0] == "operation"] == [
+        "build_manifest", "render_page", "footer_links", "show_page",
+    ]
+
+    recorded.clear()
+    client.get("/dummy/dummy/page/page-3/")
+    assert ("cache", "render", True) in recorded
+    assert ("cache", "manifest_local", True) in recorded
+
+
+@pytest.mark.django_db
+def test_disabled(event, pages, settings, django_assert_num_queries):
+    # Even if metrics are enabled in pretix, as every measurement would be written to Redis
+    settings.METRICS_ENABLED = True
+    assert metrics.get_backends() == []
+    with django_assert_num_queries(3):
+        signals.footer_link_pages(event)
+
+
+@pytest.mark.django_db
+def test_log_backend(event, monkeypatch, caplog):
+    monkeypatch.setenv("PRETIX_PRETIX_PAGES_METRICS", "log")
+    with caplog.at_level(logging.INFO, logger="pretix_pages.metrics"):
+        signals.confirm_messages(event)
+    records = [json.loads(r.getMessage()) for r in caplog.records if r.name == "pretix_pages.metrics"]
+    assert records[0] == {"type": "cache", "cache": "manifest_local", "result": "miss"}
+    assert records[-1]["operation"] == "confirm_messages"
+    assert records[-1]["queries"] == 1
@@ -0,0 +1,96 @@
+import pytest
+from django.core.files.storage import default_storage
+from django.utils import translation
+from django.utils.timezone import now
+from django_scopes import scopes_disabled
+from pretix_pages import signals
+from pretix_pages.cache import invalidate_pages_cache
+from pretix_pages.models import Page
+from pretix_pages.publish import (
+    publish_pages, static_page_name, unpublish_pages,
+)
+from pretix_pages.stats import flush_page_views
+
+from .conftest import LOCALES, make_pages
+
+
+@pytest.fixture
+def pages(event, django_capture_on_commit_callbacks):
+    # Settings changed in an open transaction stay marked as changed for later tests,
+    # unless the transaction is committed
+    with django_capture_on_commit_callbacks(execute=True):
+        event.settings.pages_publish_static = True
+    return make_pages(event, 3)
+
+
+def read(event, slug, locale):
+    with default_storage.open(static_page_name(event, slug, locale)) as f:
+        return f.read().decode()
+
+
+@pytest.mark.django_db
+def test_publish_incrementally(event, pages):
+    with scopes_disabled():
+        assert publish_pages(event) == 3 * len(LOCALES)
+        html = read(event, "page-1", "de")
+        assert "<h3>Page 1</h3>" in html
+        assert "Page 1 (de)" in html
+        # The page is rendered within the layout of the event
+        assert "Dummy" in html and "</html>" in html
+
+        assert publish_pages(event) == 0
+
+        Page.objects.filter(pk=pages[1].pk).update(last_modified=now())
+        assert publish_pages(event) == len(LOCALES)
+
+
+@pytest.mark.django_db
+def test_publish_removes_deleted_pages(event, pages):
+    with scopes_disabled():
+        publish_pages(event)
+        pages[2].delete()
+        invalidate_pages_cache(event)
+        # The other pages link to the deleted page in their footer
+        assert publish_pages(event) == 2 * len(LOCALES)
+    assert not default_storage.exists(static_page_name(event, "page-2", "en"))
+    assert default_storage.exists(static_page_name(event, "page-1", "en"))
+    assert "/page-2/" not in read(event, "page-1", "en")
+
+    with scopes_disabled():
+        unpublish_pages(event)
+    assert not default_storage.exists(static_page_name(event, "page-1", "en"))
+
+
+@pytest.mark.django_db
+def test_publish_does_not_count_views(event, pages):
+    with scopes_disabled():
+        publish_pages(event)
+    flush_page_views()
+    assert flush_page_views() == 0
+
+
+@pytest.mark.django_db
+def test_static_links(event, pages, django_capture_on_commit_callbacks):
+    with django_capture_on_commit_callbacks(execute=True):
+        event.settings.pages_static_links = True
+    with translation.override("de"):
+        footer = signals.footer_link_pages(event)
+    assert footer[0]["url"] == default_storage.url(static_page_name(event, "page-0", "de"))
+
+    with django_capture_on_commit_callbacks(execute=True):
+        event.settings.pages_publish_static = False
+    with translation.override("de"):
+        footer = signals.footer_link_pages(event)
+    assert footer[0]["url"].endswith("/dummy/dummy/page/page-0/")
+
+
+@pytest.mark.django_db
+def test_settings(event, pages, admin_client, django_capture_on_commit_callbacks):
+    with django_capture_on_commit_callbacks(execute=True):
+        response = admin_client.post("/control/event/dummy/dummy/pages/settings", {
+            "pages_publish_static": "on",
+        })
+    assert response.status_code == 302
+    event.settings.flush()
+    assert event.settings.pages_publish_static
+    assert not event.settings.pages_static_links
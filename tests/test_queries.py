@@ -0,0 +1,348 @@
+"""
+Query budgets for the signal receivers and views of this plugin.
+
+Signal receivers are called directly and all of their queries are counted. Views
+also run the queries of pretix itself, e.g. for the session, settings and the
+event layout, which this plugin has no influence on. For views, only queries on
+the tables of this plugin are counted, so these tests only fail on changes made
+here.
+"""
+import json
+from contextlib import contextmanager
+
+import pytest
+from django.core.cache import cache as default_cache
+from django.db import connection
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.utils import translation
+from django_scopes import scopes_disabled
+from pretix_pages import cache, signals
+from pretix_pages.cache import pages_cache
+from pretix_pages.models import Page
+
+from .conftest import make_pages
+
+TEXT_COLUMN = '"pretix_pages_page"."text"'
+
+
+@contextmanager
+def assert_plugin_queries(num, load_text=False):
+    """
+    Asserts that ``num`` queries on the tables of this plugin are executed, and
+    unless ``load_text`` is set, that the content of the pages is not loaded.
+    """
+    with CaptureQueriesContext(connection) as ctx:
+        yield
+    queries = [q["sql"] for q in ctx.captured_queries if "pretix_pages_" in q["sql"]]
+    assert len(queries) == num, "{} queries on plugin tables executed, {} expected:\n{}".format(
+        len(queries), num, "\n".join(queries)
+    )
+    if not load_text:
+        assert not any(TEXT_COLUMN in q for q in queries), "Page content has been loaded"
+
+
+@pytest.fixture
+def page(pages):
+    return pages[3]
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("receiver", [
+    signals.footer_link_pages,
+    signals.pretixpresale_front_page_bottom,
+    signals.confirm_messages,
+])
+def test_receiver_cold_and_warm(event, pages, receiver, django_assert_num_queries):
+    with translation.override("de"):
+        # One query for the pages, two for the domain configuration used by the URLs
+        with django_assert_num_queries(3):
+            receiver(event)
+        with django_assert_num_queries(0):
+            receiver(event)
+
+
+@pytest.mark.django_db
+def test_receivers_share_manifest(event, pages, django_assert_num_queries):
+    with django_assert_num_queries(3):
+        footer = signals.footer_link_pages(event)
+    with django_assert_num_queries(0):
+        front_page = signals.pretixpresale_front_page_bottom(event)
+        messages = signals.confirm_messages(event)
+    assert len(footer) == 25
+    assert "/page-3/" in front_page and "/page-4/" not in front_page
+    assert "page-1" in messages["pages"]
+
+
+@pytest.mark.django_db
+def test_receivers_cold_after_change(event, pages, admin_client, page, django_assert_num_queries):
+    signals.footer_link_pages(event)
+    admin_client.post("/control/event/dummy/dummy/pages/{}/".format(page.pk), {
+        "title_0": "Changed", "text_0": "<p>Changed</p>", "link_in_footer": "on",
+    })
+    # The domain configuration is still cached by pretix
+    with django_assert_num_queries(1):
+        footer = signals.footer_link_pages(event)
+    assert "Changed" in [str(link["label"]) for link in footer]
+
+
+@pytest.mark.django_db
+def test_receivers_without_pages(event, django_assert_num_queries):
+    with django_assert_num_queries(1):
+        assert signals.footer_link_pages(event) == []
+    with django_assert_num_queries(0):
+        assert signals.pretixpresale_front_page_bottom(event) == ""
+        assert signals.confirm_messages(event) == {}
+
+
+@pytest.mark.django_db
+def test_receivers_local_cache(event, pages, monkeypatch):
+    signals.footer_link_pages(event)
+    keys = []
+    get = default_cache.get
+
+    def counting_get(key, *args, **kwargs):
+        keys.append(key)
+        return get(key, *args, **kwargs)
+
+    monkeypatch.setattr(default_cache, "get", counting_get)
+
+    cache.begin_request()
+    try:
+        signals.footer_link_pages(event)
+        signals.pretixpresale_front_page_bottom(event)
+        signals.confirm_messages(event)
+    finally:
+        cache.end_request()
+    # Only the version stamp of the namespace is fetched from the shared cache, once
+    assert keys == ["pretix_pages:{}".format(event.pk)]
+
+
+@pytest.mark.django_db
+def test_show_page_local_cache(event, pages, client, monkeypatch):
+    client.get("/dummy/dummy/page/page-3/")
+    keys = []
+    get = default_cache.get
+
+    def counting_get(key, *args, **kwargs):
+        keys.append(key)
+        return get(key, *args, **kwargs)
+
+    monkeypatch.setattr(default_cache, "get", counting_get)
+    assert client.get("/dummy/dummy/page/page-3/").status_code == 200
+    assert keys.count("pretix_pages:{}".format(event.pk)) == 1
+
+
+@pytest.mark.django_db
+def test_receivers_local_cache_invalidated_elsewhere(event, pages, django_assert_num_queries):
+    signals.footer_link_pages(event)
+    # Pages have been changed by another process, which cleared the shared cache
+    with scopes_disabled():
+        Page.objects.filter(pk=pages[0].pk).update(slug="changed")
+    pages_cache(event).clear()
+    with django_assert_num_queries(1):
+        footer = signals.footer_link_pages(event)
+    assert "changed" in footer[0]["url"]
+
+
+@pytest.mark.django_db
+def test_receivers_change_during_rebuild(event, pages, monkeypatch):
+    build = cache.build_page_manifest
+
+    def build_and_change(event):
+        manifest = build(event)
+        # Pages are changed by another process while the manifest is built
+        with scopes_disabled():
+            Page.objects.filter(pk=pages[0].pk).update(slug="changed")
+        pages_cache(event).clear()
+        return manifest
+
+    monkeypatch.setattr(cache, "build_page_manifest", build_and_change)
+    assert "page-0" in signals.footer_link_pages(event)[0]["url"]
+    monkeypatch.setattr(cache, "build_page_manifest", build)
+    # The outdated manifest has not been stored for the new version of the namespace
+    assert "changed" in signals.footer_link_pages(event)[0]["url"]
+
+
+@pytest.mark.django_db
+def test_receivers_during_rebuild(event, pages, django_assert_num_queries):
+    signals.footer_link_pages(event)
+    pages_cache(event).clear()
+    # Another process is re-building the manifest, the last one is served meanwhile
+    default_cache.add("pretix_pages:{}:manifest_lock".format(event.pk), "other")
+    with django_assert_num_queries(0):
+        assert len(signals.footer_link_pages(event)) == 25
+
+
+@pytest.mark.django_db
+def test_receivers_during_first_build(event, pages, monkeypatch, django_assert_num_queries):
+    monkeypatch.setattr(cache, "MANIFEST_WAIT_TIMEOUT", 0)
+    default_cache.add("pretix_pages:{}:manifest_lock".format(event.pk), "other")
+    # Without a manifest to serve, it is built after waiting for the other process
+    with django_assert_num_queries(3):
+        assert len(signals.footer_link_pages(event)) == 25
+
+
+@pytest.mark.django_db
+def test_html_head_receivers(event, django_assert_num_queries):
+    request = RequestFactory().get("/dummy/dummy/page/page-3/")
+    with django_assert_num_queries(0):
+        signals.html_head_presale(event, request=request)
+        signals.html_head_control(event, request=request)
+
+
+@pytest.mark.django_db
+def test_show_page(event, pages, client):
+    # manifest, missing render, content, render stored
+    with assert_plugin_queries(4, load_text=True):
+        response = client.get("/dummy/dummy/page/page-3/")
+    assert response.status_code == 200
+    assert b"<h3>Page 3</h3>" in response.content and b"Page 3 (en)" in response.content
+    with assert_plugin_queries(1):  # render
+        response = client.get("/dummy/dummy/page/page-3/")
+    assert b"<h3>Page 3</h3>" in response.content
+
+
+@pytest.mark.django_db
+def test_show_page_not_in_manifest(event, pages, client):
+    client.get("/dummy/dummy/page/page-3/")
+    with scopes_disabled():
+        Page.objects.create(event=event, slug="new", title="New", text="<p>New</p>")
+    # The manifest has not been invalidated, so the page is looked up in the database
+    with assert_plugin_queries(4, load_text=True):  # page, missing render, content, render stored
+        response = client.get("/dummy/dummy/page/new/")
+    assert b"<p>New</p>" in response.content
+
+
+@pytest.mark.django_db
+def test_show_page_deleted(event, pages, client):
+    client.get("/dummy/dummy/page/page-4/")
+    with scopes_disabled():
+        Page.objects.filter(slug="page-3").delete()
+    # The manifest has not been invalidated, but there is no content to show
+    response = client.get("/dummy/dummy/page/page-3/")
+    assert response.status_code == 404
+
+
+@pytest.mark.django_db
+def test_show_page_not_modified(event, pages, client):
+    response = client.get("/dummy/dummy/page/page-3/")
+    with assert_plugin_queries(0):
+        response = client.get("/dummy/dummy/page/page-3/", HTTP_IF_NONE_MATCH=response["ETag"])
+    assert response.status_code == 304
+
+
+@pytest.mark.django_db
+def test_show_page_modified_with_other_pages(event, pages, client):
+    response = client.get("/dummy/dummy/page/page-3/")
+    etag = response["ETag"]
+    # The footer of the page links to the other pages
+    with scopes_disabled():
+        Page.objects.filter(slug="page-0").update(title="Renamed")
+    cache.invalidate_pages_cache(event)
+
+    response = client.get("/dummy/dummy/page/page-3/", HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200
+    assert b"Renamed" in response.content
+
+
+@pytest.mark.django_db
+def test_show_page_response_cache(event, pages, client, monkeypatch):
+    monkeypatch.setenv("PRETIX_PRETIX_PAGES_RESPONSE_CACHE_TIMEOUT", "60")
+    client.get("/dummy/dummy/page/page-3/")
+    with assert_plugin_queries(0):
+        response = client.get("/dummy/dummy/page/page-3/")
+    assert response.status_code == 200
+
+
+@pytest.mark.django_db
+def test_show_page_response_cache_query_string(event, pages, client, monkeypatch):
+    monkeypatch.setenv("PRETIX_PRETIX_PAGES_RESPONSE_CACHE_TIMEOUT", "60")
+    client.get("/dummy/dummy/page/page-3/?next=elsewhere")
+    # The query string can be part of the page, so the response has not been cached
+    with assert_plugin_queries(1):  # render
+        response = client.get("/dummy/dummy/page/page-3/")
+    assert "public" in response["Cache-Control"]
+    response = client.get("/dummy/dummy/page/page-3/?next=elsewhere")
+    assert "private" in response["Cache-Control"]
+
+
+@pytest.mark.django_db
+def test_event_index(event, pages, client):
+    with assert_plugin_queries(1):  # manifest
+        client.get("/dummy/dummy/")
+    with assert_plugin_queries(0):
+        response = client.get("/dummy/dummy/")
+    assert b"/dummy/dummy/page/page-3/" in response.content
+
+
+@pytest.mark.django_db
+def test_page_list(event, pages, admin_client):
+    with assert_plugin_queries(2):  # count, page of results
+        response = admin_client.get("/control/event/dummy/dummy/pages/")
+    assert response.status_code == 200
+
+
+@pytest.mark.django_db
+def test_page_edit(event, page, admin_client):
+    with assert_plugin_queries(1, load_text=True):
+        response = admin_client.get("/control/event/dummy/dummy/pages/{}/".format(page.pk))
+    assert response.status_code == 200
+
+    with assert_plugin_queries(4, load_text=True):  # page, update, render upsert, image references
+        response = admin_client.post("/control/event/dummy/dummy/pages/{}/".format(page.pk), {
+            "title_0": "Changed", "text_0": "<p>Changed</p>",
+        })
+    assert response.status_code == 302
+
+
+@pytest.mark.django_db
+def test_page_create(event, pages, admin_client):
+    with assert_plugin_queries(4, load_text=True):  # slug check, position, insert, render upsert
+        response = admin_client.post("/control/event/dummy/dummy/pages/create", {
+            "title_0": "New", "slug": "new", "text_0": "<p>New</p>",
+        })
+    assert response.status_code == 302
+
+
+@pytest.mark.django_db
+def test_page_move(event, pages, page, admin_client):
+    with assert_plugin_queries(3):  # ids, locked positions, bulk update
+        admin_client.get("/control/event/dummy/dummy/pages/{}/up".format(page.pk))
+    with scopes_disabled():
+        assert Page.objects.get(pk=page.pk).position == 2
+
+
+@pytest.mark.django_db
+def test_reorder(event, pages, admin_client):
+    ids = [p.pk for p in reversed(pages)]
+    with assert_plugin_queries(2):  # locked positions, bulk update
+        response = admin_client.post(
+            "/control/event/dummy/dummy/pages/reorder", json.dumps({"ids": ids}), content_type="application/json"
+        )
+    assert response.status_code == 200
+    with scopes_disabled():
+        assert list(Page.objects.filter(event=event).values_list("pk", flat=True)) == ids
+
+
+@pytest.mark.django_db
+def test_event_copy(event, organizer, django_assert_num_queries):
+    from pretix.base.models import Event
+
+    make_pages(event, 100)
+    with scopes_disabled():
+        clone = Event.objects.create(
+            organizer=organizer, name="Clone", slug="clone", date_from=event.date_from, plugins="pretix_pages",
+        )
+        with django_assert_num_queries(3):  # pages, renders, page insert
+            signals.event_copy_data_receiver(clone, other=event)
+        assert Page.objects.filter(event=clone).count() == 100
+
+
+@pytest.mark.django_db
+def test_warm_cache(event, pages):
+    from pretix_pages.tasks import warm_pages_cache
+
+    warm_pages_cache.apply(kwargs={"event": event.pk})
+    with assert_plugin_queries(2):  # current renders, page ids
+        warm_pages_cache.apply(kwargs={"event": event.pk})
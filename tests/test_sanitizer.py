@@ -0,0 +1,99 @@
+import pytest
+from pretix_pages.sanitizer import page_policy, sanitize_page_content
+
+PNG = "data:image/png;base64,iVBORw0KGgo="
+SVG = "data:image/svg+xml;base64,PHN2ZyB4bWxucz0iaHR0cDovL3d3dy53My5vcmcvMjAwMC9zdmciLz4="
+
+
+def test_allowed_content_is_kept():
+    html = (
+        '<h3>Title</h3><p class="lead">Some <strong>bold</strong>, <em>italic</em> and <u>underlined</u> text '
+        'with a <a href="https://pretix.eu" title="pretix" target="_blank">link</a>.</p>'
+        '<ul><li class="ql-indent-1">One</li></ul><ol><li>Two</li></ol>'
+        '<p><img src="/media/image.png" width="10" height="10" alt="Image" loading="lazy"></p>'
+        '<p><a href="mailto:info@pretix.eu">Mail</a><sub>1</sub><sup>2</sup></p>'
+    )
+    assert page_policy.sanitize(html) == html
+
+
+def test_disallowed_tags_are_removed():
+    assert page_policy.sanitize("<div><span>Text</span></div>") == "Text"
+    assert page_policy.sanitize('<p>Text<iframe src="https://example.org"></iframe></p>') == "<p>Text</p>"
+
+
+@pytest.mark.parametrize("html", [
+    "<p>Text<script>alert(1)</script></p>",
+    "<p>Text<style>p { display: none }</style></p>",
+    "<p>Text<SCRIPT>alert(1)</SCRIPT></p>",
+    "<p>Text<!-- <script>alert(1)</script> --></p>",
+])
+def test_script_and_style_are_removed_with_content(html):
+    assert page_policy.sanitize(html) == "<p>Text</p>"
+
+
+@pytest.mark.parametrize("html", [
+    '<p onclick="alert(1)">Text</p>',
+    '<img src="/media/image.png" onerror="alert(1)">',
+    '<a href="https://pretix.eu" onmouseover="alert(1)">Link</a>',
+    '<p style="background: url(javascript:alert(1))">Text</p>',
+])
+def test_event_handlers_and_styles_are_removed(html):
+    result = page_policy.sanitize(html)
+    assert "alert" not in result
+    assert "Text" in result or "Link" in result or "<img" in result
+
+
+@pytest.mark.parametrize("url", [
+    "javascript:alert(1)",
+    "JavaScript:alert(1)",
+    " javascript:alert(1)",
+    "java\nscript:alert(1)",
+    "java\tscript:alert(1)",
+    "java\x00script:alert(1)",
+    "\x01javascript:alert(1)",
+    "&#106;avascript:alert(1)",
+    "&#x6A;&#x61;vascript:alert(1)",
+    "javascript&colon;alert(1)",
+    "jav&#x09;ascript:alert(1)",
+    "vbscript:msgbox(1)",
+])
+def test_javascript_urls_are_removed(url):
+    result = page_policy.sanitize('<a href="{}">Link</a>'.format(url))
+    assert result == "<a>Link</a>"
+    result = page_policy.sanitize('<img src="{}">'.format(url))
+    assert result == "<img>"
+
+
+def test_data_urls():
+    # Only images and only in <img> elements
+    assert page_policy.sanitize('<img src="{}">'.format(PNG)) == '<img src="{}">'.format(PNG)
+    assert page_policy.sanitize('<img src="{}">'.format(SVG)) == '<img src="{}">'.format(SVG)
+    assert page_policy.sanitize('<a href="{}">Link</a>'.format(SVG)) == "<a>Link</a>"
+    assert page_policy.sanitize('<img src="data:text/html;base64,PHNjcmlwdD4=">') == "<img>"
+    assert page_policy.sanitize('<a href="{}">Link</a>'.format(PNG)) == "<a>Link</a>"
+    assert page_policy.sanitize('<a href="data:text/html,<script>alert(1)</script>">Link</a>') == "<a>Link</a>"
+
+
+def test_srcset():
+    srcset = "/media/a-480.webp 480w, https://example.org/a-960.webp 960w"
+    html = '<img src="/media/a.webp" srcset="{}">'.format(srcset)
+    assert page_policy.sanitize(html) == html
+    for bad in (
+        "/media/a-480.webp 480w, javascript:alert(1) 960w",
+        "java\nscript:alert(1) 480w",
+        "/media/a-480.webp 480w,data:text/html;base64,PHNjcmlwdD4= 960w",
+    ):
+        assert page_policy.sanitize('<img src="/media/a.webp" srcset="{}">'.format(bad)) == '<img src="/media/a.webp">'
+
+
+def test_image_callback_output_is_sanitized():
+    result = sanitize_page_content(
+        '<img src="/media/a.png">', image_callback=lambda src: {"onerror": "alert(1)", "src": "javascript:alert(1)"}
+    )
+    assert result == "<img>"
+
+
+def test_empty():
+    assert page_policy.sanitize("") == ""
+    assert page_policy.sanitize("   ") == ""
+    assert page_policy.sanitize("Text") == "Text"
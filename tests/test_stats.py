@@ -0,0 +1,52 @@
+import pytest
+from django.db.models import Sum
+from django_scopes import scopes_disabled
+from pretix_pages.models import PageViewCount
+from pretix_pages.stats import flush_page_views
+
+
+def views():
+    with scopes_disabled():
+        return dict(
+            PageViewCount.objects.values_list("page__slug", "locale").annotate(s=Sum("views")).values_list("page__slug", "s")
+        )
+
+
+@pytest.mark.django_db
+def test_views_are_flushed_after_one_interval(event, pages, client):
+    client.get("/dummy/dummy/page/page-3/")
+    client.get("/dummy/dummy/page/page-3/")
+    client.get("/dummy/dummy/page/page-4/")
+
+    # The epoch that was current during the views is only written after the next one
+    assert flush_page_views() == 0
+    client.get("/dummy/dummy/page/page-3/")
+    assert flush_page_views() == 3
+    assert views() == {"page-3": 2, "page-4": 1}
+
+    assert flush_page_views() == 1
+    assert views() == {"page-3": 3, "page-4": 1}
+    with scopes_disabled():
+        assert PageViewCount.objects.count() == 2
+
+
+@pytest.mark.django_db
+def test_deleted_pages_are_skipped(event, pages, client):
+    client.get("/dummy/dummy/page/page-3/")
+    client.get("/dummy/dummy/page/page-4/")
+    with scopes_disabled():
+        pages[4].delete()
+    flush_page_views()
+    assert flush_page_views() == 1
+    assert views() == {"page-3": 1}
+
+
+@pytest.mark.django_db
+def test_page_list(event, pages, client, admin_client):
+    for i in range(3):
+        client.get("/dummy/dummy/page/page-0/")
+    flush_page_views()
+    flush_page_views()
+    response = admin_client.get("/control/event/dummy/dummy/pages/")
+    assert response.context["pages"][0].recent_views == 3
+    assert response.context["pages"][1].recent_views == 0